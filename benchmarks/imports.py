@@ -0,0 +1,87 @@
+"""Measure the cold import time of nbsvg modules
+
+    $ python -m benchmarks.imports
+    $ python -m benchmarks.imports nbsvg.components.notebook --budget 0.3
+
+Each module is imported by a fresh interpreter with -X importtime. The
+best cumulative time over the repeats is compared with the budget of the
+module, and the imports with the highest self time are listed. Any module
+above its budget fails the run.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Seconds. Generous enough for a slow CI machine, but far below the cost
+# of importing the whole rendering stack eagerly
+BUDGETS = {
+    'nbsvg': 0.05,
+    'nbsvg.components': 0.05,
+    'nbsvg.components.text': 0.1,
+    'nbsvg.components.notebook': 0.4,
+    'nbsvg.cli': 0.1,
+}
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(code):
+    """Run code in a new interpreter. Return its [(name, self, cumulative, depth)] imports"""
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True,
+    )
+    result = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        result.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6, depth))
+    return result
+
+
+def measure(module, repeat):
+    """Return the best total import time of a module and its slowest imports
+
+    Modules that the interpreter imports on startup are not counted.
+    """
+    startup = {name for name, _, _, _ in import_times('pass')}
+    best, best_times = float('inf'), []
+    for _ in range(repeat):
+        times = [item for item in import_times(f'import {module}') if item[0] not in startup]
+        total = sum(cumulative for _, _, cumulative, depth in times if depth == 0)
+        if total < best:
+            best, best_times = total, times
+    return best, sorted(best_times, key=lambda item: item[1], reverse=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the import time of nbsvg modules')
+    parser.add_argument('modules', nargs='*', help=f'modules to import (default: {", ".join(BUDGETS)})')
+    parser.add_argument('--budget', type=float, help='budget in seconds for every module')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help='number of slowest imports to list')
+    args = parser.parse_args(argv)
+
+    failures = []
+    for module in args.modules or BUDGETS:
+        budget = args.budget if args.budget is not None else BUDGETS.get(module)
+        total, slowest = measure(module, args.repeat)
+        status = 'ok' if budget is None or total <= budget else 'OVER'
+        limit = f'{budget:.3f}s' if budget is not None else '-'
+        print(f'{module:<28} {total:8.4f}s  budget {limit:>7}  {status}')
+        for name, own, _, _ in slowest[:args.top]:
+            print(f'    {own:8.4f}s  {name}')
+        if status == 'OVER':
+            failures.append(f'{module}: {total:.4f}s > {budget:.3f}s')
+
+    for failure in failures:
+        print(f'REGRESSION {failure}', file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Benchmark the components on synthetic data
+
+    $ python -m benchmarks.run --save baseline.json
+    $ python -m benchmarks.run --compare baseline.json --threshold 0.2
+
+Each case reports the best wall time over the repeats, the peak traced
+memory of one build and the size of the produced SVG. lxml allocates its
+trees outside of tracemalloc, so the process max RSS is recorded as well. With --compare,
+any metric above its baseline by more than the threshold fails the run.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import nbformat
+
+from nbsvg.components import (
+    Code, DataframeTable, GroupSequence, Image, Markdown, Notebook, SVGElement, Text, WrapTable
+)
+from nbsvg.components.cache import BUILD_CACHE
+
+from . import synthetic
+
+METRICS = ('time', 'peak_memory', 'output_bytes')
+# Cases that run with the default BUILD_CACHE. The others disable it, so
+# that each repeat measures the build itself
+CACHED_CASES = ('NotebookCached',)
+
+
+def scaled_knobs(scale):
+    knobs = {
+        key: max(1, int(value * scale)) if value else 0
+        for key, value in synthetic.DEFAULTS.items()
+    }
+    knobs['figure_size'] = synthetic.DEFAULTS['figure_size']
+    return knobs
+
+
+def create_cases(knobs, directory):
+    rng = random.Random(0)
+    code = synthetic.code_text(knobs['code_lines'] * knobs['code_cells'], rng)
+    stream = synthetic.stream_text(knobs['stream_lines'])
+    table = synthetic.table_data(knobs['dataframe_rows'], knobs['dataframe_cols'], rng)
+    dataframe = synthetic.dataframe_html(knobs['dataframe_rows'], knobs['dataframe_cols'], rng)
+    markdown = synthetic.markdown_text(knobs['markdown_paragraphs'], rng)
+    figures = [
+        synthetic.png_base64(knobs['figure_size'], knobs['figure_size'] * 3 // 4, i)
+        for i in range(knobs['figures'])
+    ]
+    path = os.path.join(directory, 'synthetic.ipynb')
+    nbformat.write(synthetic.generate(**knobs), path)
+
+    def images():
+        group = GroupSequence()
+        for figure in figures:
+            group.add(Image(figure))
+        return group
+
+    return {
+        'Code': lambda: Code(code),
+        'Text': lambda: Text(stream),
+        'WrapTable': lambda: WrapTable(json.loads(json.dumps(table)), [0]),
+        'DataframeTable': lambda: DataframeTable(dataframe),
+        'Markdown': lambda: Markdown(markdown),
+        'Image': images,
+        'Notebook': lambda: Notebook(path),
+        'NotebookCached': lambda: Notebook(path),
+    }
+
+
+def render(factory):
+    return SVGElement().add(factory()).xml
+
+
+def measure(factory, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        BUILD_CACHE.clear()
+        start = time.perf_counter()
+        svg = render(factory)
+        best = min(best, time.perf_counter() - start)
+    BUILD_CACHE.clear()
+    tracemalloc.start()
+    try:
+        render(factory)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'time': best,
+        'peak_memory': peak,
+        'output_bytes': len(svg),
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def compare(results, baseline, threshold):
+    failures = []
+    for name, result in results['cases'].items():
+        expected = baseline.get('cases', {}).get(name)
+        if expected is None:
+            continue
+        for metric in METRICS:
+            if expected[metric] and result[metric] > expected[metric] * (1 + threshold):
+                failures.append(
+                    f'{name}.{metric}: {result[metric]:.6g} > {expected[metric]:.6g} '
+                    f'(+{result[metric] / expected[metric] - 1:.1%})'
+                )
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark nbsvg components')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the synthetic sizes')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='*', help='run only these cases')
+    parser.add_argument('--save', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', help='compare the results with a JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative regression')
+    args = parser.parse_args(argv)
+
+    cache_size = BUILD_CACHE.maxsize
+    knobs = scaled_knobs(args.scale)
+    results = {
+        'knobs': knobs,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cases': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for name, factory in create_cases(knobs, directory).items():
+            if args.only and name not in args.only:
+                continue
+            BUILD_CACHE.maxsize = cache_size if name in CACHED_CASES else 0
+            result = results['cases'][name] = measure(factory, args.repeat)
+            print(
+                f'{name:<14} {result["time"]:9.4f}s {result["peak_memory"] / 2**20:9.2f} MiB '
+                f'{result["output_bytes"]:>12,d} bytes'
+            )
+
+    if args.save:
+        with open(args.save, 'w') as fil:
+            json.dump(results, fil, indent=2)
+    if args.compare:
+        with open(args.compare) as fil:
+            baseline = json.load(fil)
+        if baseline.get('knobs') != knobs:
+            print('warning: baseline was recorded with different sizes', file=sys.stderr)
+        failures = compare(results, baseline, args.threshold)
+        for failure in failures:
+            print(f'REGRESSION {failure}', file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Generate synthetic notebooks for benchmarks
+
+    $ python -m benchmarks.synthetic big.ipynb --dataframe-rows 10000
+"""
+import argparse
+import base64
+import random
+import struct
+import zlib
+
+import nbformat
+from nbformat.v4 import new_code_cell, new_markdown_cell, new_notebook, new_output
+
+
+DEFAULTS = {
+    'code_cells': 20,
+    'code_lines': 200,
+    'dataframe_rows': 10000,
+    'dataframe_cols': 8,
+    'figures': 20,
+    'figure_size': 400,
+    'svg_figures': 10,
+    'markdown_paragraphs': 200,
+    'traceback_lines': 2000,
+    'stream_lines': 20000,
+}
+
+
+def code_text(lines, rng):
+    body = []
+    for i in range(lines):
+        indent = '    ' * (i % 3)
+        choice = i % 5
+        if choice == 0:
+            body.append(f'{indent}def function_{i}(value, other=None):')
+        elif choice == 1:
+            body.append(f'{indent}result = [x ** 2 for x in range({rng.randint(1, 100)}) if x % 3]')
+        elif choice == 2:
+            body.append(f'{indent}print("line {i}", result, {rng.random():.4f})  # comment {i}')
+        elif choice == 3:
+            body.append(f'{indent}data = {{"key": {i}, "name": \'value\', "items": (1, 2.5, None)}}')
+        else:
+            body.append(f'{indent}return value + {i}')
+    return '\n'.join(body)
+
+
+def png_base64(width, height, seed):
+    """Build an uncompressed-looking PNG without requiring PIL"""
+    rng = random.Random(seed)
+    color = bytes(rng.randrange(256) for _ in range(3))
+    raw = b''.join(b'\x00' + color * width for _ in range(height))
+
+    def chunk(kind, data):
+        return (
+            struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+        )
+
+    png = (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(raw))
+        + chunk(b'IEND', b'')
+    )
+    return base64.b64encode(png).decode('ascii')
+
+
+def svg_figure(index, points=200):
+    rng = random.Random(index)
+    path = ' '.join(f'L{x * 2} {rng.randint(0, 200)}' for x in range(points))
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="400" height="200">'
+        f'<path d="M0 100 {path}" stroke="blue" fill="none"/></svg>'
+    )
+
+
+def dataframe_html(rows, cols, rng):
+    header = ''.join(f'<th>column_{j}</th>' for j in range(cols))
+    body = ''.join(
+        f'<tr><th>{i}</th>' + ''.join(
+            f'<td>{rng.random() * 1000:.3f}</td>' if j % 2 else f'<td>text value {i}-{j}</td>'
+            for j in range(cols)
+        ) + '</tr>'
+        for i in range(rows)
+    )
+    return (
+        '<div><table border="1" class="dataframe"><thead><tr style="text-align: right;">'
+        f'<th></th>{header}</tr></thead><tbody>{body}</tbody></table>'
+        f'<p>{rows} rows × {cols} columns</p></div>'
+    )
+
+
+def table_data(rows, cols, rng):
+    """Return table rows in the Table/WrapTable format"""
+    header = [{'value': '', 'bold': True, 'lines': ['']}] + [
+        {'value': f'column_{j}', 'bold': True, 'lines': [f'column_{j}']} for j in range(cols)
+    ]
+    data = [header]
+    for i in range(rows):
+        row = [{'value': f'{i}', 'bold': True, 'lines': [f'{i}']}]
+        for j in range(cols):
+            value = f'{rng.random() * 1000:.3f}' if j % 2 else f'text value {i}-{j}'
+            row.append({'value': value, 'bold': False, 'lines': [value]})
+        data.append(row)
+    return data
+
+
+def markdown_text(paragraphs, rng):
+    words = ['lorem', 'ipsum', '**dolor**', 'sit', '*amet*', '`consectetur`', 'adipiscing', 'elit']
+    blocks = []
+    for i in range(paragraphs):
+        if i % 20 == 0:
+            blocks.append(f'## Section {i // 20}')
+        if i % 7 == 3:
+            blocks.append('\n'.join(f'- item {k} ' + ' '.join(rng.choice(words) for _ in range(8)) for k in range(4)))
+        else:
+            blocks.append(' '.join(rng.choice(words) for _ in range(rng.randint(30, 80))))
+    return '\n\n'.join(blocks)
+
+
+def traceback_lines(lines):
+    result = ['\x1b[38;5;9m---------------------------------------------------------------------------\x1b[0m']
+    for i in range(lines):
+        result.append(
+            f'\x1b[0;32mFile /path/to/module_{i}.py:{i}\x1b[0m, in \x1b[0;36mfunction_{i}\x1b[0;34m(value)\x1b[0m\n'
+            f'\x1b[1;31;40m---> {i} \x1b[0m\x1b[38;5;28;01mreturn\x1b[39;00m value\x1b[38;2;98;98;98m+\x1b[0m{i}'
+        )
+    result.append('\x1b[0;31mValueError\x1b[0m: synthetic error')
+    return result
+
+
+def stream_text(lines):
+    return ''.join(
+        f'[{i:06d}] \x1b[32mINFO\x1b[0m processing batch {i} loss={1 / (i + 1):.6f}\n'
+        for i in range(lines)
+    )
+
+
+def generate(seed=0, **knobs):
+    """Return a synthetic notebook. Unknown knobs raise TypeError"""
+    unknown = set(knobs) - set(DEFAULTS)
+    if unknown:
+        raise TypeError(f'Unknown knobs: {", ".join(sorted(unknown))}')
+    knobs = {**DEFAULTS, **knobs}
+    rng = random.Random(seed)
+    cells = [new_markdown_cell(markdown_text(knobs['markdown_paragraphs'], rng))]
+    count = 0
+
+    def code_cell(source, outputs=()):
+        nonlocal count
+        count += 1
+        for output in outputs:
+            if output.get('output_type') == 'execute_result':
+                output['execution_count'] = count
+        return new_code_cell(source, execution_count=count, outputs=list(outputs))
+
+    for _ in range(knobs['code_cells']):
+        cells.append(code_cell(code_text(knobs['code_lines'], rng)))
+    if knobs['dataframe_rows']:
+        cells.append(code_cell('df', [new_output('execute_result', data={
+            'text/html': dataframe_html(knobs['dataframe_rows'], knobs['dataframe_cols'], rng),
+            'text/plain': 'df',
+        })]))
+    for i in range(knobs['figures']):
+        cells.append(code_cell(f'plot({i})', [new_output('display_data', data={
+            'image/png': png_base64(knobs['figure_size'], knobs['figure_size'] * 3 // 4, i),
+            'text/plain': '<Figure>',
+        })]))
+    for i in range(knobs['svg_figures']):
+        cells.append(code_cell(f'svg({i})', [new_output('display_data', data={
+            'image/svg+xml': svg_figure(i),
+        })]))
+    if knobs['traceback_lines']:
+        cells.append(code_cell('fail()', [new_output(
+            'error', ename='ValueError', evalue='synthetic error',
+            traceback=traceback_lines(knobs['traceback_lines']),
+        )]))
+    if knobs['stream_lines']:
+        cells.append(code_cell('train()', [new_output(
+            'stream', name='stdout', text=stream_text(knobs['stream_lines'])
+        )]))
+    return new_notebook(cells=cells)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic notebook')
+    parser.add_argument('output', help='path of the generated notebook')
+    parser.add_argument('--seed', type=int, default=0)
+    for knob, default in DEFAULTS.items():
+        parser.add_argument(f'--{knob.replace("_", "-")}', type=int, default=default)
+    args = vars(parser.parse_args(argv))
+    output = args.pop('output')
+    nbformat.write(generate(**args), output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1 @@
-from style import STYLE
\ No newline at end of file
+from .style import STYLE
@@ -0,0 +1,143 @@
+"""Asyncio entry points for rendering notebooks
+
+HTML outputs are rasterized by wkhtmltoimage subprocesses that the event
+loop waits on, and the CPU-bound layout, highlighting, image encoding and
+serialization run in an executor, so the loop is never blocked.
+"""
+import asyncio
+import functools
+
+from . import raster
+
+
+def image_command(options=None, command='wkhtmltoimage'):
+    """Return the arguments that imgkit.from_string(html, False, options) runs"""
+    args = [command]
+    for key, value in (options or {}).items():
+        key = key.lower() if key.startswith('--') else f'--{key.lower()}'
+        for item in value if isinstance(value, (list, tuple)) else [value]:
+            args.append(key)
+            if isinstance(item, (list, tuple)):
+                args.extend(str(part) for part in item)
+            elif item:
+                args.append(str(item))
+    args.extend(('-', '-'))
+    return args
+
+
+async def wkhtmltoimage(html, options=None, command='wkhtmltoimage'):
+    """Render html with an asyncio subprocess and return the image bytes"""
+    args = image_command(options, command)
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await process.communicate(('<meta charset="UTF-8">' + html).encode('utf-8'))
+    except asyncio.CancelledError:
+        process.kill()
+        raise
+    stderr = stderr.decode('utf-8', errors='replace')
+    if process.returncode != 0 or 'Error' in stderr:
+        raise OSError(f'wkhtmltoimage exited with code {process.returncode}:\n{stderr}')
+    return stdout
+
+
+class AsyncRasterizer:
+    """Rasterize HTML on the event loop, with at most `workers` subprocesses
+
+    Results are stored in the disk cache and handed to a Rasterizer, so the
+    synchronous build that follows finds them without spawning anything.
+    """
+
+    def __init__(self, rasterizer=None, workers=4, command='wkhtmltoimage'):
+        self.rasterizer = rasterizer or raster.RASTERIZER
+        self.workers = workers
+        self.command = command
+        self._semaphore = None
+
+    async def render(self, html, options=None):
+        rasterizer = self.rasterizer
+        key = rasterizer.key(html, options)
+        data = rasterizer.read_cache(key)
+        if data is None:
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.workers)
+            async with self._semaphore:
+                data = await wkhtmltoimage(html, options, self.command)
+            rasterizer.write_cache(key, data)
+        rasterizer.seed(html, data, options)
+        return data
+
+    async def prefetch(self, htmls, options=None):
+        """Rasterize all htmls concurrently. Raise the first failure once all are done"""
+        results = await asyncio.gather(
+            *(self.render(html, options) for html in dict.fromkeys(htmls)), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    def __repr__(self):
+        return f'AsyncRasterizer(workers={self.workers!r})'
+
+
+def html_outputs(path, validate=True):
+    from .components import Notebook
+    notebook = Notebook(path, validate=validate)
+    return [html for cell in notebook.create_cells(notebook.load()) for html in cell.html_outputs()]
+
+
+def write_notebook(path, output, validate=True, precision=None):
+    """Render a notebook in the calling thread"""
+    from .components import Notebook, SVGElement
+    from .optimize import Optimizer
+    svg = SVGElement().add(Notebook(path, validate=validate, prefetch_html=False))
+    if output is None:
+        if precision is not None:
+            svg.optimize(precision)
+        return svg.xml
+    optimizer = Optimizer(precision=precision) if precision is not None else None
+    return svg.write(output, optimize=optimizer)
+
+
+async def render_notebook_async(path, output=None, validate=True, precision=None, executor=None, rasterizer=None):
+    """Render a notebook without blocking the event loop
+
+    HTML outputs are rasterized first with asyncio subprocesses. The layout
+    then runs in executor (the loop default when None). Return the SVG bytes
+    when output is None, else write it and return the optimization report.
+    """
+    loop = asyncio.get_running_loop()
+    rasterizer = rasterizer or AsyncRasterizer()
+    htmls = await loop.run_in_executor(executor, html_outputs, path, validate)
+    try:
+        await rasterizer.prefetch(htmls)
+        return await loop.run_in_executor(
+            executor, functools.partial(write_notebook, path, output, validate, precision)
+        )
+    finally:
+        # Cached builds do not rasterize, so release what they did not take
+        rasterizer.rasterizer.forget(htmls)
+
+
+async def render_notebooks_async(tasks, limit=4, executor=None, rasterizer=None, **kwargs):
+    """Render (path, output) pairs with at most limit notebooks at a time
+
+    Return the results in order. Failures are returned as exceptions.
+    """
+    semaphore = asyncio.Semaphore(limit)
+    rasterizer = rasterizer or AsyncRasterizer()
+
+    async def render(path, output):
+        async with semaphore:
+            return await render_notebook_async(
+                path, output, executor=executor, rasterizer=rasterizer, **kwargs
+            )
+
+    return await asyncio.gather(
+        *(render(path, output) for path, output in tasks), return_exceptions=True
+    )
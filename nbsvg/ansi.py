@@ -0,0 +1,143 @@
+"""ANSI escape sequences as SVG text attributes
+
+AnsiState follows SGR codes the way a terminal does: the state carries
+over from one line to the next, and text runs that end up with the same
+attributes are merged, so a colorized log produces one tspan per visible
+color change instead of one per escape code.
+"""
+import re
+
+CSI = re.compile(r'\x1b\[([0-9;:?]*)([@-~])')
+SEPARATOR = re.compile('[;:]')
+
+BASIC = (
+    'black',
+    'rgb(187, 0, 0)',
+    'rgb(0, 187, 0)',
+    'rgb(187, 187, 0)',
+    'rgb(0, 0, 187)',
+    'rgb(187, 0, 187)',
+    'rgb(0, 187, 187)',
+    'rgb(187, 187, 187)',
+)
+BRIGHT = (
+    'rgb(85, 85, 85)',
+    'rgb(255, 85, 85)',
+    'rgb(85, 255, 85)',
+    'rgb(255, 255, 85)',
+    'rgb(85, 85, 255)',
+    'rgb(255, 85, 255)',
+    'rgb(85, 255, 255)',
+    'rgb(255, 255, 255)',
+)
+CUBE = (0, 95, 135, 175, 215, 255)
+
+
+def palette(index):
+    """Return the fill of a 256-color palette index"""
+    if index < 8:
+        return BASIC[index]
+    if index < 16:
+        return BRIGHT[index - 8]
+    if index < 232:
+        index -= 16
+        return f'rgb({CUBE[index // 36]}, {CUBE[index // 6 % 6]}, {CUBE[index % 6]})'
+    level = 8 + 10 * (min(index, 255) - 232)
+    return f'rgb({level}, {level}, {level})'
+
+
+def extended_color(codes, i):
+    """Parse 38/48 arguments starting at codes[i]. Return (color, last index)"""
+    if i + 1 < len(codes) and codes[i + 1] == 5:
+        if i + 2 < len(codes):
+            return palette(codes[i + 2]), i + 2
+        return None, len(codes)
+    if i + 1 < len(codes) and codes[i + 1] == 2:
+        if i + 4 < len(codes):
+            red, green, blue = (min(value, 255) for value in codes[i + 2:i + 5])
+            return f'rgb({red}, {green}, {blue})', i + 4
+        return None, len(codes)
+    return None, i
+
+
+class AnsiState:
+    """SGR state of a terminal and the SVG attributes it maps to"""
+
+    def __init__(self, color='black'):
+        self.color = color
+        self._attrs = {}
+        self.reset()
+
+    def reset(self):
+        self.fill = None
+        self.bold = False
+        self.italic = False
+        self.underline = False
+
+    def attr(self):
+        key = (self.fill, self.bold, self.italic, self.underline)
+        attr = self._attrs.get(key)
+        if attr is None:
+            attr = {'fill': self.fill or self.color}
+            if self.bold:
+                attr['font-weight'] = 'bold'
+            if self.italic:
+                attr['font-style'] = 'italic'
+            if self.underline:
+                attr['text-decoration'] = 'underline'
+            self._attrs[key] = attr
+        return attr
+
+    def apply(self, params):
+        codes = [int(code) if code else 0 for code in SEPARATOR.split(params.lstrip('?'))]
+        i = 0
+        while i < len(codes):
+            code = codes[i]
+            if code == 0:
+                self.reset()
+            elif code == 1:
+                self.bold = True
+            elif code == 22:
+                self.bold = False
+            elif code == 3:
+                self.italic = True
+            elif code == 23:
+                self.italic = False
+            elif code == 4:
+                self.underline = True
+            elif code == 24:
+                self.underline = False
+            elif 30 <= code <= 37:
+                self.fill = BASIC[code - 30]
+            elif 90 <= code <= 97:
+                self.fill = BRIGHT[code - 90]
+            elif code == 39:
+                self.fill = None
+            elif code in (38, 48):
+                color, i = extended_color(codes, i)
+                if code == 38 and color is not None:
+                    self.fill = color
+            i += 1
+
+    def runs(self, line):
+        """Return the (text, attr) runs of a line and advance the state"""
+        if '\x1b' not in line:
+            return [(line, self.attr())] if line else []
+        result = []
+        position = 0
+        for match in CSI.finditer(line):
+            self._add(result, line[position:match.start()])
+            if match.group(2) == 'm':
+                self.apply(match.group(1))
+            position = match.end()
+        self._add(result, line[position:])
+        return result
+
+    def _add(self, result, text):
+        if not text:
+            return
+        attr = self.attr()
+        if result and result[-1][1] is attr:
+            result[-1] = (result[-1][0] + text, attr)
+        else:
+            result.append((text, attr))
@@ -0,0 +1,199 @@
+"""Command line interface for rendering notebooks to SVG"""
+import argparse
+import glob
+import itertools
+import os
+import sys
+import time
+import traceback
+
+from multiprocessing import Pool
+
+
+def expand_paths(paths):
+    """Expand files, globs and directories into a sorted list of notebooks"""
+    result = []
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, '**', '*.ipynb'), recursive=True)
+        elif glob.has_magic(path):
+            matches = glob.glob(path, recursive=True)
+        else:
+            matches = [path]
+        for match in sorted(matches):
+            if '.ipynb_checkpoints' in match.split(os.sep):
+                continue
+            if match not in seen:
+                seen.add(match)
+                result.append(match)
+    return result
+
+
+def output_path(path, output_dir=None, root=None, suffix='.svg'):
+    base = os.path.splitext(path)[0] + suffix
+    if output_dir is None:
+        return base
+    if root is not None:
+        base = os.path.relpath(base, root)
+    else:
+        base = os.path.basename(base)
+    return os.path.join(output_dir, base)
+
+
+def warm_imports():
+    """Import the rendering stack once per worker process"""
+    from .components import Notebook, SVGElement  # noqa: F401
+    import pygments.lexers.python  # noqa: F401
+
+
+def render_file(task):
+    path, output, options, page = task
+    start = time.perf_counter()
+    try:
+        from .components import Notebook, SVGElement
+        from .optimize import Optimizer
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        optimizer = None
+        if options['precision'] is not None:
+            optimizer = Optimizer(precision=options['precision'])
+        if page is None:
+            page = Notebook(path, validate=options['validate'])
+        report = SVGElement().add(page).write(output, optimize=optimizer)
+    except Exception:
+        return path, output, time.perf_counter() - start, None, traceback.format_exc()
+    return path, output, time.perf_counter() - start, report, None
+
+
+def page_tasks(tasks, page_height, failures):
+    """Split each notebook task into one task per page
+
+    Notebooks that cannot be paginated are appended to failures as results.
+    """
+    from .components import Notebook
+    from .pages import page_path
+    for path, output, options, _ in tasks:
+        start = time.perf_counter()
+        try:
+            pages = Notebook(path, validate=options['validate']).paginate(page_height)
+        except Exception:
+            failures.append((path, output, time.perf_counter() - start, None, traceback.format_exc()))
+            continue
+        for page in pages:
+            yield path, page_path(output, page.number), options, page
+
+
+def render(args):
+    paths = expand_paths(args.paths)
+    if not paths:
+        print('nbsvg: no notebooks found', file=sys.stderr)
+        return 2
+    root = None
+    if args.output_dir is not None and len(args.paths) == 1 and os.path.isdir(args.paths[0]):
+        root = args.paths[0]
+    suffix = '.svgz' if args.svgz else '.svg'
+    options = {'validate': args.validate, 'precision': args.optimize}
+    tasks = [(path, output_path(path, args.output_dir, root, suffix), options, None) for path in paths]
+    planning = []
+    if args.page_height:
+        tasks = page_tasks(tasks, args.page_height, planning)
+
+    failures = 0
+    start = time.perf_counter()
+    if args.jobs == 1:
+        warm_imports()
+        results = map(render_file, tasks)
+        pool = None
+    else:
+        pool = Pool(
+            processes=args.jobs or None,
+            initializer=warm_imports,
+            maxtasksperchild=args.max_tasks_per_child or None,
+        )
+        results = pool.imap_unordered(render_file, tasks)
+    count = 0
+    try:
+        for path, output, elapsed, report, error in itertools.chain(results, planning):
+            count += 1
+            if error is None:
+                if not args.quiet:
+                    saved = f' ({report["saved"]:,d} bytes saved)' if report else ''
+                    print(f'ok    {elapsed:8.3f}s  {path} -> {output}{saved}')
+            else:
+                failures += 1
+                print(f'FAIL  {elapsed:8.3f}s  {path}', file=sys.stderr)
+                if args.verbose:
+                    print(error, file=sys.stderr)
+                else:
+                    print('      ' + error.strip().splitlines()[-1], file=sys.stderr)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    total = time.perf_counter() - start
+    print(
+        f'{count - failures} rendered, {failures} failed in {total:.3f}s',
+        file=sys.stderr
+    )
+    return 1 if failures else 0
+
+
+COMMANDS = ('render', 'serve')
+
+
+def serve(args):
+    from .server import serve
+    warm_imports()
+    return serve(args.host, args.port, args.socket, args.quiet, args.root)
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog='nbsvg', description='Convert Jupyter Notebooks to SVG')
+    subparsers = parser.add_subparsers(dest='command')
+
+    render_parser = subparsers.add_parser('render', help='render notebooks to SVG files')
+    render_parser.add_argument('paths', nargs='+', help='notebook files, globs or directories')
+    render_parser.add_argument('-o', '--output-dir', help='directory for the SVG files (default: next to each notebook)')
+    render_parser.add_argument('-z', '--svgz', action='store_true', help='write gzip compressed .svgz files')
+    render_parser.add_argument('-j', '--jobs', type=int, default=0, help='number of worker processes (default: cpu count)')
+    render_parser.add_argument(
+        '--max-tasks-per-child', type=int, default=50,
+        help='recycle each worker after this many notebooks (0 disables)'
+    )
+    render_parser.add_argument(
+        '--no-validate', dest='validate', action='store_false',
+        help='skip nbformat schema validation and decode cells lazily'
+    )
+    render_parser.add_argument(
+        '-O', '--optimize', nargs='?', type=int, const=2, metavar='PRECISION',
+        help='shrink the SVG with CSS classes, flattened translates and coordinates rounded to PRECISION decimals (default: 2)'
+    )
+    render_parser.add_argument(
+        '--page-height', type=float, metavar='PIXELS',
+        help='write one SVG per page of this height (notebook-001.svg, ...), breaking between cells or outputs'
+    )
+    render_parser.add_argument('-q', '--quiet', action='store_true', help='only report failures')
+    render_parser.add_argument('-v', '--verbose', action='store_true', help='print full tracebacks for failures')
+    render_parser.set_defaults(func=render)
+
+    serve_parser = subparsers.add_parser('serve', help='render notebooks over HTTP with warm caches')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    serve_parser.add_argument('-p', '--port', type=int, default=8000, help='port to listen on (default: 8000)')
+    serve_parser.add_argument('--socket', help='listen on this Unix socket instead of TCP')
+    serve_parser.add_argument('-q', '--quiet', action='store_true', help='do not log requests')
+    serve_parser.add_argument('--root', default='.', help='directory of the notebooks that can be rendered (default: .)')
+    serve_parser.set_defaults(func=serve)
+    return parser
+
+
+def main(argv=None):
+    parser = create_parser()
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv and argv[0] not in COMMANDS and argv[0] not in ('-h', '--help'):
+        argv.insert(0, 'render')
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        sys.exit(2)
+    sys.exit(args.func(args))
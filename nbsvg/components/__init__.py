@@ -1,15 +1,39 @@
-from .base import StylizedElement
-from .code import Code
-from .group import Group, GroupSequence
-from .svg_element import SVGElement
-from .cell import CellInput, CellOutput, CellDisplay, Cell, ellipsis
-from .text import Text, CodeSpan, Line, TSpan, LineBreak
-from .table import DataframeTable, Table, WrapTable
-from .image import Image, SVGGroup
-from .output import html_output
-from .html import HTML
-from .glist import List
-from .markdown import HRule, Quote, Markdown
-from .output import Error, display_data
-from .notebook import Notebook
-from .drawing import TextBox, SVGNode
+"""SVG components
+
+Submodules are imported on first access, so a script that only uses Code
+or Text does not load mistune, nbformat or the notebook machinery.
+"""
+import importlib
+
+MODULES = {
+    'base': ('StylizedElement',),
+    'code': ('Code',),
+    'group': ('Group', 'GroupSequence'),
+    'svg_element': ('SVGElement',),
+    'cell': ('CellInput', 'CellOutput', 'CellDisplay', 'Cell', 'ellipsis'),
+    'text': ('Text', 'CodeSpan', 'Line', 'TSpan', 'LineBreak'),
+    'table': ('DataframeTable', 'Table', 'WrapTable'),
+    'image': ('Image', 'SVGGroup'),
+    'html': ('HTML',),
+    'glist': ('List',),
+    'markdown': ('HRule', 'Quote', 'Markdown'),
+    'output': ('Error', 'display_data', 'html_output'),
+    'notebook': ('Notebook', 'Page'),
+    'drawing': ('TextBox', 'SVGNode'),
+}
+LOCATIONS = {name: module for module, names in MODULES.items() for name in names}
+
+__all__ = list(LOCATIONS)
+
+
+def __getattr__(name):
+    module = LOCATIONS.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,23 +1,92 @@
 from lxml import etree
 from .. import style as main_style
+from .cache import BUILD_CACHE
 
 
 class StylizedElement:
 
     def __init__(self, *args, **kwargs):
         self._built = False
+        self._measured = None
         self.x = self.y = 0
         self.kwargs = kwargs
 
-    def do_build(self, style=None, **kwargs):
+    def build_style(self, style=None, **kwargs):
         if not style:
             style = main_style.STYLE
-        style = style.apply({**self.kwargs, **kwargs}, this=False)
+        return style.apply({**self.kwargs, **kwargs})
+
+    def do_build(self, style=None, **kwargs):
+        style = self.build_style(style, **kwargs)
+        key = BUILD_CACHE.key(self, style)
+        cached = BUILD_CACHE.get(key) if key else None
+        if cached is None:
+            self.build(style)
+            if key:
+                BUILD_CACHE.put(key, self)
+        else:
+            self.element, self.width, self.height = cached
+        self.set_transform()
+        self._built = True
+        return self
+
+    def do_measure(self, style=None, **kwargs):
+        """Compute width and height, deferring the element tree to do_emit"""
+        style = self.build_style(style, **kwargs)
+        key = BUILD_CACHE.key(self, style)
+        size = BUILD_CACHE.size(key) if key else None
+        if size is None:
+            self.measure(style)
+        else:
+            self.width, self.height = size
+        self._measured = (style, key, size is not None)
+        return self
+
+    def do_emit(self):
+        """Create the element of a measured component"""
+        style, key, cached = self._measured
+        entry = BUILD_CACHE.get(key, record=False) if cached else None
+        if entry is None:
+            if cached:
+                self.measure(style)
+            self.emit(style)
+            if key:
+                BUILD_CACHE.put(key, self)
+        else:
+            self.element, self.width, self.height = entry
+        self.set_transform()
+        self._built = True
+        self._measured = None
+        return self
+
+    def build(self, style):
+        self.measure(style)
+        self.emit(style)
+
+    def measure(self, style):
+        """Set width and height, keeping what emit needs
+
+        Subclasses override either build or both measure and emit. By
+        default, measuring builds the element tree.
+        """
         self.build(style)
+
+    def emit(self, style):
+        """Create self.element from the state left by measure"""
+
+    def cache_key(self):
+        """Return the inputs that fully determine build, or None to disable caching"""
+        return None
+
+    def set_transform(self):
         if self.x != 0 or self.y != 0:
             self.element.set('transform', f'translate({self.x}, {self.y})')
-        self._built = True
-        return self
+
+    def release(self):
+        """Drop the built element tree"""
+        self.element = None
+        self._built = False
+        self._measured = None
 
     def translate(self, x, y, add=False):
         if add:
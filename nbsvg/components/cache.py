@@ -0,0 +1,128 @@
+"""In-process LRU cache of built components"""
+import hashlib
+import json
+import threading
+
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from lxml import etree
+
+
+def _default(obj):
+    if isinstance(obj, type):
+        return f'{obj.__module__}.{obj.__qualname__}'
+    if isinstance(obj, bytes):
+        return hashlib.sha1(obj).hexdigest()
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f'cannot fingerprint {type(obj).__qualname__} objects')
+
+
+def fingerprint(*parts):
+    """Return a stable hash of json-like parts
+
+    Raise TypeError for objects without a stable representation.
+    """
+    data = json.dumps(parts, sort_keys=True, default=_default, ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class BuildCache:
+    """Maps component inputs and style fingerprints to built elements
+
+    Components opt in by returning their inputs from cache_key(). Inputs
+    that cannot be fingerprinted disable caching for the component.
+    Entries store the serialized element, so each hit parses a new copy
+    that the caller is free to modify. The cache holds at most maxsize
+    entries and maxbytes of serialized elements; larger elements (e.g.,
+    big embedded images) are not cached.
+    """
+
+    def __init__(self, maxsize=256, maxbytes=32 << 20):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, component, style):
+        if not self.maxsize:
+            return None
+        inputs = component.cache_key()
+        if inputs is None:
+            return None
+        try:
+            return fingerprint(type(component), inputs, style.fingerprint())
+        except TypeError:
+            return None
+
+    def get(self, key, record=True):
+        """Return a copy of (element, width, height), or None
+
+        record=False skips the hit statistics, for lookups that size()
+        already counted.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += record
+                return None
+            self._entries.move_to_end(key)
+            self.hits += record
+        data, tail, width, height = entry
+        element = etree.fromstring(data)
+        element.tail = tail
+        return element, width, height
+
+    def size(self, key):
+        """Return the (width, height) of an entry without copying its element"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry[2], entry[3]
+
+    def put(self, key, component):
+        data = etree.tostring(component.element, with_tail=False)
+        if len(data) > self.maxbytes // 4:
+            return
+        entry = (data, component.element.tail, component.width, component.height)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= len(previous[0])
+            self._entries[key] = entry
+            self.nbytes += len(data)
+            while len(self._entries) > self.maxsize or self.nbytes > self.maxbytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= len(evicted[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.nbytes = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'bytes': self.nbytes,
+            'maxbytes': self.maxbytes,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f'BuildCache(maxsize={self.maxsize!r}, maxbytes={self.maxbytes!r})'
+
+
+BUILD_CACHE = BuildCache()
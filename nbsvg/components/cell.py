@@ -3,7 +3,7 @@ from .base import StylizedElement
 from .code import Code
 from .markdown import Markdown
 from .group import GroupSequence
-from .output import display_data, stream_output, Error
+from .output import display_data, rasterized_html, stream_output, Error
 from .text import Text
 from .image import SVGGroup
 
@@ -35,16 +35,23 @@ class CellInput(StylizedElement):
         self.number = number
         self.text = text
 
-    def build(self, style):
-        style.input_width += 25 if style.showtext else 0
+    def measure(self, style):
+        if style.showtext:
+            style = style.apply({'input_width': style.input_width + 25})
+        self._code = Code(self.text).translate(style.input_width, 5)
+        self._code.do_measure(style, width=style.width - style.input_width)
+        self.width = style.width
+        self.height = self._code.height + 10
+
+    def emit(self, style):
+        if style.showtext:
+            style = style.apply({'input_width': style.input_width + 25})
         self.element = inout(
             self.number, 6 + 5, "#307fc1", style,
             text="In " if style.showtext else ""
         )
-        code = Code(self.text).translate(style.input_width, 5)
-        self.element.append(code.do_build(style, width=style.width - style.input_width).element)
-        self.width = style.width
-        self.height = code.height + 10
+        self.element.append(self._code.do_emit().element)
+        self._code = None
 
     def __repr__(self):
         return f'CellInput({self.number!r}, {self.text!r})'
@@ -57,16 +64,22 @@ class CellOutput(StylizedElement):
         self.number = number
         self.output = output
 
-    def build(self, style):
-        style.input_width += 25 if style.showtext else 0
+    def measure(self, style):
+        if style.showtext:
+            style = style.apply({'input_width': style.input_width + 25})
+        output = self.output.translate(style.input_width + 7, 0)
+        output.do_measure(style, width=style.width - style.input_width)
+        self.width = style.width
+        self.height = output.height + 5
+
+    def emit(self, style):
+        if style.showtext:
+            style = style.apply({'input_width': style.input_width + 25})
         self.element = inout(
             self.number, 0, "#bf5b3d", style,
             text="Out" if style.showtext else ""
         )
-        output = self.output.translate(style.input_width + 7, 0)
-        self.element.append(output.do_build(style, width=style.width - style.input_width).element)
-        self.width = style.width
-        self.height = output.height + 5
+        self.element.append(self.output.do_emit().element)
 
     def __repr__(self):
         return f'CellOutput({self.number!r}, {self.output!r})'
@@ -78,13 +91,15 @@ class CellDisplay(StylizedElement):
         super().__init__(**kwargs)
         self.output = output
 
-    def build(self, style):
-        self.element = E.g()
+    def measure(self, style):
         output = self.output.translate(style.input_width + 7, 0)
-        self.element.append(output.do_build(style, width=style.width - style.input_width).element)
+        output.do_measure(style, width=style.width - style.input_width)
         self.width = style.width
         self.height = output.height
 
+    def emit(self, style):
+        self.element = E.g(self.output.do_emit().element)
+
     def __repr__(self):
         return f'CellDisplay({self.output!r})'
 
@@ -104,6 +119,8 @@ class Cell(StylizedElement):
         self._replace_execution_count = None
         self._result_kwargs = {}
         self._display_kwargs = {}
+        self._output_style = {}
+        self._blocks = None
         self.result = None
         
     def replace_cell(self, component):
@@ -136,14 +153,39 @@ class Cell(StylizedElement):
     def replace_execution_count(self, ec):
         self._replace_execution_count = ec
 
-    def build(self, style):
+    def output_lines(self, max_lines, head_lines=None, tail_lines=None):
+        self._output_style = {'output_max_lines': max_lines}
+        if head_lines is not None:
+            self._output_style['output_head_lines'] = head_lines
+        if tail_lines is not None:
+            self._output_style['output_tail_lines'] = tail_lines
+
+    def select_blocks(self, start, stop=None):
+        """Keep only the input and output blocks in [start, stop) of a code cell"""
+        self._blocks = (start, stop)
+
+    def cache_key(self):
+        replacements = (
+            self._replace_cell, self._replace_input, self._replace_outputs,
+            self._replace_result, self._replace_display
+        )
+        if any(replacement is not None for replacement in replacements):
+            return None
+        return (
+            getattr(self.cell, 'digest', self.cell), self._remove_input, self._remove_outputs,
+            self._replace_execution_count, self._result_kwargs, self._display_kwargs,
+            self._output_style, self._blocks
+        )
+
+    def create_result(self):
+        """Return the unbuilt component that renders the cell"""
         cell_type = self.cell.get('cell_type', '')
         source = self.cell.get('source', '')
         if self._replace_cell:
-            result = self._replace_cell.do_build(style)
-        elif cell_type == 'markdown':
-            result = Markdown(source).do_build(style)
-        elif cell_type == 'code':
+            return self._replace_cell
+        if cell_type == 'markdown':
+            return Markdown(source)
+        if cell_type == 'code':
             result = GroupSequence(group_margin=0)
             execution_count = self._replace_execution_count or self.cell.get('execution_count', ' ') or ' '
             cell_input = self._replace_input or CellInput(execution_count, source)
@@ -158,24 +200,66 @@ class Cell(StylizedElement):
                         if output_type == 'execute_result':
                             result.add(self._replace_result or CellOutput(
                                 execution_count, 
-                                display_data(output.get('data', {}), **self._result_kwargs)
+                                display_data(
+                                    output.get('data', {}), output.get('metadata', {}),
+                                    **self._result_kwargs
+                                ),
+                                **self._output_style
                             ))
                         elif output_type == 'stream':
-                            result.add(self._replace_display or CellDisplay(stream_output(output)))
+                            result.add(self._replace_display or CellDisplay(
+                                stream_output(output), **self._output_style
+                            ))
                         elif output_type == 'display_data':
                             result.add(self._replace_display or CellDisplay( 
-                                display_data(output.get('data', {}), **self._display_kwargs)
+                                display_data(
+                                    output.get('data', {}), output.get('metadata', {}),
+                                    **self._display_kwargs
+                                ),
+                                **self._output_style
                             ))
                         elif output_type == 'error':
                             result.add(CellDisplay(Error(output)))
-            result = result.do_build(style)
-        else:
-            result = Text(source).do_build(style)
-        self.result = result
-        self.element = result.element
-        self.width = result.width
-        self.height = result.height
+            if self._blocks is not None:
+                result.items = result.items[slice(*self._blocks)]
+            return result
+        return Text(source)
+
+    def build(self, style):
+        self.result = self.create_result().do_build(style)
+        self.element = self.result.element
+        self.width = self.result.width
+        self.height = self.result.height
+
+    def measure(self, style):
+        self.result = self.create_result().do_measure(style)
+        self.width = self.result.width
+        self.height = self.result.height
+
+    def emit(self, style):
+        self.element = self.result.do_emit().element
     
+    def html_outputs(self):
+        """Yield the HTML outputs that the build will rasterize"""
+        if self.cell.get('cell_type', '') != 'code' or self._replace_cell:
+            return
+        if self._remove_outputs or self._replace_outputs:
+            return
+        for output in self.cell.get('outputs', []):
+            output_type = output.get('output_type', '')
+            if output_type == 'execute_result' and self._replace_result:
+                continue
+            if output_type == 'display_data' and self._replace_display:
+                continue
+            if output_type in ('execute_result', 'display_data'):
+                html = rasterized_html(output.get('data', {}))
+                if html is not None:
+                    yield html
+
+    def release(self):
+        super().release()
+        self.result = None
+
     def __repr__(self):
         return f'Cell({self.cell!r})'
 
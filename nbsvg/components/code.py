@@ -1,11 +1,9 @@
-from lxml import etree
 from lxml.builder import E
 
-from pygments import highlight
-from pygments.formatters import SvgFormatter
 from pygments.lexers import PythonLexer
 
 from .base import StylizedElement
+from ..highlight import highlight, line_offsets
 from ..pygments_style import JupyterLabLightStyle
 
 
@@ -16,19 +14,24 @@ class Code(StylizedElement):
         self.text = text
         self.lexer = lexer
         self.pygments_style = pygments_style
-        
-    def build(self, style):
-        formatter = SvgFormatter(style=self.pygments_style, nowrap=True, fontsize=f"{style.fontsize}px")
-        cellcode = highlight(self.text, self.lexer(), formatter)
+
+    def cache_key(self):
+        return self.text, self.lexer, self.pygments_style
+
+    def measure(self, style):
+        yoffset, ystep = line_offsets(style.fontsize)
         self.width = style.width
-        self.height = formatter.yoffset + len(self.text.split("\n")) * formatter.ystep
+        self.height = yoffset + (self.text.count("\n") + 1) * ystep
+
+    def emit(self, style):
+        cellcode = highlight(self.text, self.lexer, self.pygments_style, style.fontsize)
         self.element = E.g(
             E.rect({
                 'x': '0', 'y': '0', 'width': f'{self.width}', 'height': f'{self.height}',
                 'fill': 'rgb(245, 245, 245)', 'stroke': 'rgb(222, 222, 222)'
             }),
             E.g(
-                etree.fromstring(f'<g>{cellcode}</g>', parser=etree.XMLParser(recover=True)), {
+                cellcode, {
                     'transform': f'translate({style.code_padding} {style.code_padding})',
                     'font-family': 'monospace', 'font-size': f'{style.fontsize}px'
                 }
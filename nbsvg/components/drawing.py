@@ -23,13 +23,13 @@ class TextBox(StylizedElement):
         self.width = self.width or text.width + 2*self.padding
         self.height = self.height or text.height + 2*self.padding
         if align == 'start':
-            text = text.translate(self.padding, self.padding)
+            text.translate(self.padding, self.padding)
         elif align == 'middle':
-            text = text.translate(self.width/2, self.padding)
+            text.translate(self.width/2, self.padding)
         elif align == 'end':
-            text = text.translate(self.width - self.padding, self.padding)
-        text = text.do_build(style)
-        
+            text.translate(self.width - self.padding, self.padding)
+        text.set_transform()
+
         self.element = E.g(
             E.rect({
                 'x': '0', 'y': '0', 'width': f'{self.width - 1}', 'height': f'{self.height}',
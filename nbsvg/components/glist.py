@@ -11,8 +11,8 @@ class List(StylizedElement):
         self.group = group
         self.ordered = ordered
         
-    def build(self, style):
-        group = self.group.translate(25, 0).do_build(style, width=style.width - 25)
+    def measure(self, style):
+        group = self.group.translate(25, 0).do_measure(style, width=style.width - 25)
         side_group = Group()
         for i, item in enumerate(group):
             text = "•"
@@ -23,10 +23,13 @@ class List(StylizedElement):
         side = 15
         if self.ordered:
             side = 10
-        side_group = side_group.translate(side, 0).do_build(style)
-        self.element = E.g(side_group.element, group.element)
+        self._side_group = side_group.translate(side, 0).do_measure(style)
         self.width = group.width + 25
         self.height = group.height
+
+    def emit(self, style):
+        self.element = E.g(self._side_group.do_emit().element, self.group.do_emit().element)
+        self._side_group = None
         
     def __repr__(self):
         return f'List({self.group!r}, {self.ordered!r})'
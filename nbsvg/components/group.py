@@ -18,6 +18,18 @@ class Group(StylizedElement):
             self.height = max(self.height, item.y + item.height)
             self.width = max(self.width, item.x + item.width)
 
+    def measure(self, style):
+        self.height = self.width = 0
+        for item in self.items:
+            item.do_measure(style)
+            self.height = max(self.height, item.y + item.height)
+            self.width = max(self.width, item.x + item.width)
+
+    def emit(self, style):
+        self.element = self.etype()
+        for item in self.items:
+            self.element.append(item.do_emit().element)
+
     def add(self, obj):
         self.items.append(obj)
         return self
@@ -39,17 +51,33 @@ class GroupSequence(StylizedElement):
 
     def build(self, style):
         self.element = self.etype()
+        for obj in self.iter_build(style):
+            self.element.append(obj.element)
+
+    def iter_build(self, style, keep=True):
+        """Build and place items one at a time, yielding each built item"""
         self.height = style.group_margin
         self.width = 0
         for obj, sep in self.items:
-            self.element.append(
-                obj
-                .translate(0, self.height - self.undo.get(id(obj), 0), add=True)
-                .do_build(style).element
-            )
+            obj.translate(0, self.height - self.undo.get(id(obj), 0), add=True).do_build(style)
             self.undo[id(obj)] = self.height
             self.height += obj.height + sep
             self.width = max(self.width, obj.width)
+            yield obj
+
+    def measure(self, style):
+        self.height = style.group_margin
+        self.width = 0
+        for obj, sep in self.items:
+            obj.translate(0, self.height - self.undo.get(id(obj), 0), add=True).do_measure(style)
+            self.undo[id(obj)] = self.height
+            self.height += obj.height + sep
+            self.width = max(self.width, obj.width)
+
+    def emit(self, style):
+        self.element = self.etype()
+        for obj, _ in self.items:
+            self.element.append(obj.do_emit().element)
 
     def __add__(self, other):
         if isinstance(other, str):
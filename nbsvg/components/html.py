@@ -1,5 +1,6 @@
 from .image import Image
 from .base import StylizedElement
+from .. import raster
 
 class HTML(StylizedElement):
 
@@ -8,8 +9,7 @@ class HTML(StylizedElement):
         self.html = html
 
     def build(self, style):
-        import imgkit
-        res = imgkit.from_string(self.html, False)
+        res = raster.RASTERIZER.render(self.html)
         image = Image(res).do_build(style)
         self.width = image.width
         self.height = image.height
@@ -1,43 +1,147 @@
 
 import base64
+import hashlib
+import os
+import struct
 from io import BytesIO
 from lxml.builder import E
 from lxml import etree
 
 from .base import StylizedElement
 
+XLINK_HREF = '{http://www.w3.org/1999/xlink}href'
+JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def sniff_image(data):
+    """Return (mimetype, width, height) from the header of PNG, JPEG, GIF or WebP data
+
+    Returns None for other formats and (mimetype, None, None) when data
+    is too short to reach the size fields.
+    """
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        if len(data) < 24:
+            return 'image/png', None, None
+        return ('image/png',) + struct.unpack('>II', data[16:24])
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        if len(data) < 10:
+            return 'image/gif', None, None
+        return ('image/gif',) + struct.unpack('<HH', data[6:10])
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        chunk = data[12:16]
+        if chunk == b'VP8 ' and len(data) >= 30:
+            width, height = struct.unpack('<HH', data[26:30])
+            return 'image/webp', width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L' and len(data) >= 25:
+            bits = int.from_bytes(data[21:25], 'little')
+            return 'image/webp', (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b'VP8X' and len(data) >= 30:
+            return (
+                'image/webp',
+                int.from_bytes(data[24:27], 'little') + 1,
+                int.from_bytes(data[27:30], 'little') + 1,
+            )
+        if chunk in (b'VP8 ', b'VP8L', b'VP8X'):
+            return 'image/webp', None, None
+        return None
+    if data.startswith(b'\xff\xd8'):
+        pos = 2
+        while pos + 9 <= len(data):
+            if data[pos] != 0xFF:
+                return None
+            marker = data[pos + 1]
+            if marker == 0xFF:
+                pos += 1
+                continue
+            if marker in JPEG_SOF:
+                height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+                return 'image/jpeg', width, height
+            pos += 2 + struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        return 'image/jpeg', None, None
+    return None
+
+
+def b64_prefix(b64, size):
+    """Decode only the beginning of a base64 string"""
+    prefix = ''.join(b64[:size].split())
+    return base64.b64decode(prefix[:len(prefix) // 4 * 4])
+
 
 class Image(StylizedElement):
     
-    def __init__(self, url, force_width=None, **kwargs):
+    def __init__(self, url, force_width=None, metadata=None, reencode=False, **kwargs):
         super().__init__(**kwargs)
         self.url = url
         self.force_width = force_width
+        self.metadata = metadata or {}
+        self.reencode = reencode
 
-    def build(self, style):
-        from PIL import Image
-        fontsize = style.fontsize
+    def cache_key(self):
+        return self.url, self.force_width, self.metadata, self.reencode
+
+    def load(self):
+        """Return (base64, raw bytes) for the payload, decoding as little as possible"""
         url = self.url
         if isinstance(url, str) and url.startswith('data:'):
-            url = base64.b64decode(url.rsplit(',')[-1])
-        elif isinstance(url, str) and len(url) > 200:
-            url = base64.b64decode(url)
-        if isinstance(url, bytes):
-            url = BytesIO(url)
+            return url.rsplit(',')[-1], None
+        if isinstance(url, str) and len(url) > 200:
+            return url, None
+        if isinstance(url, (str, os.PathLike)):
+            with open(url, 'rb') as fil:
+                url = fil.read()
+        elif hasattr(url, 'read'):
+            url = url.read()
+        return None, url
+
+    def sniff(self, b64, data):
+        if data is not None:
+            return sniff_image(data)
+        size = 64
+        while True:
+            info = sniff_image(b64_prefix(b64, size))
+            if info is None or info[1] is not None or size >= len(b64):
+                return info
+            size *= 8
+
+    def build(self, style):
+        b64, data = self.load()
+        info = None if self.reencode else self.sniff(b64, data)
+        if info is None or info[1] is None:
+            # Unknown format or transform requested: decode and re-encode as PNG
+            mimetype, width, height, b64 = self.decode(b64, data)
+        else:
+            mimetype, width, height = info
+            if b64 is None:
+                b64 = base64.b64encode(data).decode('utf-8')
+            elif '\n' in b64:
+                b64 = ''.join(b64.split())
+        meta_width = self.metadata.get('width')
+        meta_height = self.metadata.get('height')
+        if meta_width and meta_height:
+            width, height = meta_width, meta_height
+        elif meta_width:
+            width, height = meta_width, height * meta_width / width
 
-        image = Image.open(url)
-        width, height = image.size
         self.width = self.force_width or min(width, style.width)
         self.height = height * self.width / width
 
+        self.element = E.image({
+            'width': f'{self.width}', 'height': f'{self.height}',
+            XLINK_HREF: f'data:{mimetype};base64,{b64}'
+        })
+
+    def decode(self, b64, data):
+        from PIL import Image
+        if data is None:
+            data = base64.b64decode(b64)
+        image = Image.open(BytesIO(data))
+        width, height = image.size
+
         #image = image.resize((int(self.width), int(self.height)), Image.ANTIALIAS)
 
         buffer = BytesIO()
         image.save(buffer, format="PNG")
-        self.element = E.image({
-            'width': f'{self.width}', 'height': f'{self.height}',
-            '{http://www.w3.org/1999/xlink}href': f'data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode("utf-8")}'
-        })
+        return 'image/png', width, height, base64.b64encode(buffer.getvalue()).decode("utf-8")
 
     def __repr__(self):
         return f'Image({self.url!r})'
@@ -49,7 +153,10 @@ class SVGGroup(StylizedElement):
         super().__init__(**kwargs)
         self.svg = svg
         self.default_height = default_height
-        
+
+    def cache_key(self):
+        return self.svg, self.default_height
+
     def build(self, style):
         self.element = etree.XML(self.svg)
         self.width = style.width
@@ -62,3 +169,61 @@ class SVGGroup(StylizedElement):
         
     def __repr__(self):
         return f'SVGGroup({self.svg!r})'
+
+
+class ImageDefs:
+    """Share embedded images through <symbol>s keyed by content hash
+
+    process() replaces each data URI <image> of a tree with a <use> of the
+    same size and returns the new tree root. uses() only creates the <use>s,
+    for callers that swap them in and out of a tree. Each distinct image
+    becomes a single <symbol> in defs().
+    """
+
+    def __init__(self, prefix='image-'):
+        self.prefix = prefix
+        self.symbols = {}
+
+    def images(self, element):
+        """Return the data URI <image>s of a tree that process() replaces"""
+        return [
+            image for image in element.iter('image')
+            if image.get(XLINK_HREF, '').startswith('data:')
+            and image.get('width') is not None and image.get('height') is not None
+        ]
+
+    def uses(self, element):
+        """Return (image, use) pairs for the data URI <image>s of a tree"""
+        pairs = []
+        for image in self.images(element):
+            href = image.get(XLINK_HREF)
+            symbol_id = self.symbol(href, image.get('width'), image.get('height'))
+            use = etree.Element('use', {XLINK_HREF: f'#{symbol_id}'})
+            for attribute, value in image.attrib.items():
+                if attribute != XLINK_HREF:
+                    use.set(attribute, value)
+            use.tail = image.tail
+            pairs.append((image, use))
+        return pairs
+
+    def process(self, element):
+        for image, use in self.uses(element):
+            if image is element:
+                return use
+            image.getparent().replace(image, use)
+        return element
+
+    def symbol(self, href, width, height):
+        digest = hashlib.sha1(href.encode('utf-8')).hexdigest()[:16]
+        symbol_id = f'{self.prefix}{digest}'
+        if digest not in self.symbols:
+            self.symbols[digest] = E.symbol(
+                {'id': symbol_id, 'viewBox': f'0 0 {width} {height}', 'preserveAspectRatio': 'none'},
+                E.image({'width': width, 'height': height, XLINK_HREF: href})
+            )
+        return symbol_id
+
+    def defs(self):
+        if not self.symbols:
+            return None
+        return E.defs(*self.symbols.values())
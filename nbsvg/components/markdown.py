@@ -1,11 +1,10 @@
 import mistune
 
 from lxml.builder import E
-from pygments import lexers
 
 from .base import StylizedElement
 from .glist import List
-from .text import breakgroup_to_lines, split_by_linebreak, flat_tspan, breakgroup
+from .text import break_lines, split_by_linebreak, flat_tspan, breakgroup
 from .text import CodeSpan, Line, TSpan, LineBreak
 from .group import GroupSequence, force_groupsequence
 from .image import Image
@@ -15,27 +14,39 @@ from .code import Code
 
 from .. import style
 
+# Lexer classes, or their names in pygments.lexers to resolve them on first use
 LEXER_MAP = {
-    'bash': lexers.BashLexer,
-    'html': lexers.HtmlLexer,
-    'javascript': lexers.JavascriptLexer,
-    'perl': lexers.PerlLexer,
-    'python': lexers.PythonLexer,
-    'ruby': lexers.RubyLexer,
-    'tex': lexers.TexLexer,
-    '': lexers.HtmlLexer,
+    'bash': 'BashLexer',
+    'html': 'HtmlLexer',
+    'javascript': 'JavascriptLexer',
+    'perl': 'PerlLexer',
+    'python': 'PythonLexer',
+    'ruby': 'RubyLexer',
+    'tex': 'TexLexer',
+    '': 'HtmlLexer',
 }
 
+
+def get_lexer(lang):
+    """Return the lexer class of a code block language"""
+    lexer = LEXER_MAP.get(lang, LEXER_MAP[''])
+    if isinstance(lexer, type):
+        return lexer
+    from pygments import lexers
+    return getattr(lexers, lexer)
+
 class HRule(StylizedElement):
             
-    def build(self, style):
+    def measure(self, style):
+        self.width = style.width
+        self.height = 4
+
+    def emit(self, style):
         self.element = E.g(
             E.rect(
             {'x': '0', 'y': '1', 'width': f'{style.width}', 
              'height': '2', 'fill': 'rgb(220, 220, 220)'}
         ))
-        self.width = style.width
-        self.height = 4
 
     def __repr__(self):
         return 'HRule()'
@@ -47,10 +58,13 @@ class Quote(StylizedElement):
         super().__init__(**kwargs)
         self.text = text
 
-    def build(self, style):
-        text = self.text.translate(35, 0).do_build(style, width=style.width - 35)
+    def measure(self, style):
+        text = self.text.translate(35, 0).do_measure(style, width=style.width - 35)
         self.height = text.height + 5
         self.width = text.width + 35
+
+    def emit(self, style):
+        text = self.text.do_emit()
         self.element = E.g(
             E.rect({
                 'x': '23', 'y': '0', 'width': '4', 
@@ -69,6 +83,15 @@ class SVGRenderer(mistune.Renderer):
         super().__init__()
         self.style = style
     
+    def wrap(self, text, name, fontsize, bold=False):
+        style = self.style.apply({'fontsize': fontsize, 'fontfamily': self.style.markdown_fontfamily})
+        limit = self.style.linewidth(self.style.width, name)
+        lines = GroupSequence()
+        for line in split_by_linebreak(text):
+            for group in break_lines(line, limit, style, bold=bold):
+                lines.add(group)
+        return lines
+
     def create_lines(self, lines, fontsize, fontfamily, extra={}):
         result = GroupSequence(group_margin=fontsize)
         for line in lines:
@@ -108,18 +131,9 @@ class SVGRenderer(mistune.Renderer):
         return GroupSequence(group_margin=0)
     
     def paragraph(self, text):
-        text = force_groupsequence(flat_tspan(text))
-        nested_lines = [
-            breakgroup_to_lines(
-                line,
-                self.style.fontlen(self.style.width, "p")
-            ) for line in split_by_linebreak(text)
-        ]
-        lines = GroupSequence()
-        for linegroup in nested_lines:
-            for group in linegroup:
-                lines.add(group)
-        
+        lines = self.wrap(
+            force_groupsequence(flat_tspan(text)), "p", self.style.p_fontsize
+        )
         return self.create_lines(
             lines, self.style.p_fontsize,
             self.style.markdown_fontfamily,
@@ -127,9 +141,8 @@ class SVGRenderer(mistune.Renderer):
     
     def header(self, text, level, raw=None):
         fontsize = getattr(self.style, f"h{level}_fontsize")
-        lines = breakgroup_to_lines(
-            force_groupsequence(flat_tspan(text)),
-            self.style.fontlen(self.style.width, f"h{level}")
+        lines = self.wrap(
+            force_groupsequence(flat_tspan(text)), f"h{level}", fontsize, bold=True
         )
         return self.create_lines(
             lines, fontsize, 
@@ -140,10 +153,7 @@ class SVGRenderer(mistune.Renderer):
         )
         
     def block_code(self, code, lang=None):
-        if lang not in LEXER_MAP:
-            lang = ''
-        lexer = LEXER_MAP[lang]      
-        return Code(code, lexer=lexer)
+        return Code(code, lexer=get_lexer(lang))
 
     def block_quote(self, text):
         return Quote(text)
@@ -190,18 +200,32 @@ class SVGRenderer(mistune.Renderer):
         return WrapTable(table_data, header_rows)
     
     def list_item(self, text):
-        return text
+        return force_groupsequence(text)
     
     def list(self, body, ordered=True):
-        body = force_groupsequence(flat_tspan(body))
-        lines = GroupSequence()
-        for tspan in body:
-            lines.add(GroupSequence().add(tspan))
-        result = self.create_lines(
-            lines, self.style.p_fontsize,
-            self.style.markdown_fontfamily,
-        )
+        fontsize = self.style.p_fontsize
+        result = GroupSequence(group_margin=fontsize)
+        for item in force_groupsequence(body):
+            entry = GroupSequence(group_margin=0)
+            inline = GroupSequence()
+            for element in force_groupsequence(flat_tspan(item)):
+                if isinstance(element, (TSpan, CodeSpan)):
+                    inline.add(element)
+                    continue
+                self.add_lines(entry, inline, fontsize)
+                inline = GroupSequence()
+                entry.add(element)
+            self.add_lines(entry, inline, fontsize)
+            result.add(entry)
+        result.translate(0, fontsize // 2)
         return List(result, ordered)
+
+    def add_lines(self, entry, inline, fontsize):
+        for line in self.wrap(inline, "p", fontsize):
+            entry.add(Line(
+                [tspan for tspan in line],
+                fontsize=fontsize, fontfamily=self.style.markdown_fontfamily,
+            ))
     
     # ToDo:
     # escape(self, text)
@@ -216,13 +240,19 @@ class Markdown(StylizedElement):
         super().__init__(**kwargs)
         self.markdown = markdown
 
-    def build(self, style):
+    def cache_key(self):
+        return self.markdown
+
+    def measure(self, style):
         renderer = SVGRenderer(style=style)
         markdownfn = mistune.Markdown(renderer=renderer, escape=False)
-        obj = markdownfn(self.markdown).do_build(style)
-        self.element = obj.element
-        self.width = obj.width
-        self.height = obj.height
+        self._root = markdownfn(self.markdown).do_measure(style)
+        self.width = self._root.width
+        self.height = self._root.height
+
+    def emit(self, style):
+        self.element = self._root.do_emit().element
+        self._root = None
 
     def __repr__(self):
         return f'Markdown({self.markdown!r})'
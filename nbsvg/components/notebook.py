@@ -1,36 +1,96 @@
-import nbformat
+import os
+
+from contextlib import contextmanager
+from itertools import islice
+from lxml import etree
+from lxml.builder import E
 
 from .group import GroupSequence
 from .cell import Cell
+from .cache import fingerprint
+from .. import raster
+from ..loader import read_notebook
+
+from collections import defaultdict, deque
 
-from collections import defaultdict
+
+class NotebookIndex(object):
+    """Positions of the cells of a notebook by execution_count, id and tag"""
+
+    def __init__(self, cells):
+        self.counts = defaultdict(list)
+        self.ids = {}
+        self.tags = defaultdict(list)
+        for position, cell in enumerate(cells):
+            count = cell.get('execution_count', None)
+            if count is not None:
+                self.counts[count].append(position)
+            cell_id = cell.get('id', None)
+            if cell_id is not None:
+                self.ids[cell_id] = position
+            for tag in cell.get('metadata', {}).get('tags', ()):
+                self.tags[tag].append(position)
+
+    def positions(self, counts=(), ids=(), tags=()):
+        result = set()
+        for count in counts:
+            result.update(self.counts.get(count, ()))
+        for cell_id in ids:
+            if cell_id in self.ids:
+                result.add(self.ids[cell_id])
+        for tag in tags:
+            result.update(self.tags.get(tag, ()))
+        return sorted(result)
 
 
 class Notebook(GroupSequence):
     
-    def __init__(self, filename, indexes=None, counts=None, order=None, **kwargs):
+    def __init__(self, filename, indexes=None, counts=None, order=None, ids=None, tags=None, prefetch_html=True, validate=True, jobs=None, executor=None, loader=read_notebook, **kwargs):
         if not 'group_margin' in kwargs:
             kwargs['group_margin'] = 0
         super().__init__(**kwargs)
         self.filename = filename
-        self._select_by_index = indexes
-        self._select_by_count = counts
+        self._select_by_index = list(indexes) if indexes is not None else None
+        self._select_by_count = list(counts) if counts is not None else None
+        self._select_by_id = list(ids) if ids is not None else None
+        self._select_by_tag = list(tags) if tags is not None else None
         self._index_operations = defaultdict(list)
         self._count_operations = defaultdict(list)
+        self._id_operations = defaultdict(list)
+        self._tag_operations = defaultdict(list)
         self._order = order
+        self.prefetch_html = prefetch_html
+        self.validate = validate
+        self.jobs = jobs
+        self.executor = executor
+        self.loader = loader
+        self._layout = {}
+        self._nb = None
+        self._stamp = None
+        self._index = None
         
     def select_index(self, *indexes):
         if self._select_by_index is None:
             self._select_by_index = []
-        for index in indexes:
-            self._select_by_index.append(index)
+        self._select_by_index.extend(indexes)
         return self
         
     def select_count(self, *counts):
         if self._select_by_count is None:
             self._select_by_count = []
-        for count in counts:
-            self._select_by_count.append(count)
+        self._select_by_count.extend(counts)
+        return self
+
+    def select_id(self, *ids):
+        if self._select_by_id is None:
+            self._select_by_id = []
+        self._select_by_id.extend(ids)
+        return self
+
+    def select_tag(self, *tags):
+        if self._select_by_tag is None:
+            self._select_by_tag = []
+        self._select_by_tag.extend(tags)
         return self
 
     def index_operation(self, index, operation, *value):
@@ -40,6 +100,14 @@ class Notebook(GroupSequence):
     def count_operation(self, count, operation, *value):
         self._count_operations[count].append((operation, value))
         return self
+
+    def id_operation(self, cell_id, operation, *value):
+        self._id_operations[cell_id].append((operation, value))
+        return self
+
+    def tag_operation(self, tag, operation, *value):
+        self._tag_operations[tag].append((operation, value))
+        return self
         
     def select_index_operate(self, index, operation, *value):
         self.select_index(index)
@@ -50,41 +118,262 @@ class Notebook(GroupSequence):
         self.select_count(count)
         self.count_operation(count, operation, *value)
         return self
-        
-    def build(self, style):
-        nb = nbformat.read(open(self.filename), as_version=4)
-        if not self._select_by_index and not self._select_by_count:
-            cell_indexes = range(len(nb['cells']))
+
+    def select_id_operate(self, cell_id, operation, *value):
+        self.select_id(cell_id)
+        self.id_operation(cell_id, operation, *value)
+        return self
+
+    def select_tag_operate(self, tag, operation, *value):
+        self.select_tag(tag)
+        self.tag_operation(tag, operation, *value)
+        return self
+
+    def load(self):
+        stat = os.stat(self.filename)
+        stamp = (stat.st_mtime_ns, stat.st_size, self.validate)
+        if self._nb is None or stamp != self._stamp:
+            self._nb = self.loader(self.filename, self.validate)
+            self._stamp = stamp
+            self._index = None
+        return self._nb
+
+    def index(self, nb):
+        if self._index is None:
+            self._index = NotebookIndex(nb['cells'])
+        return self._index
+
+    def select_positions(self, nb):
+        selectors = (self._select_by_count, self._select_by_id, self._select_by_tag)
+        if not self._select_by_index and not any(selectors):
+            return list(range(len(nb['cells'])))
+        positions = list(self._select_by_index or [])
+        if any(selectors):
+            positions.extend(self.index(nb).positions(*(selector or () for selector in selectors)))
+        return positions
+
+    def operations(self, nb, position):
+        ops = list(self._index_operations.get(position, ()))
+        if self._count_operations or self._id_operations or self._tag_operations:
+            cell = nb['cells'][position]
+            ops.extend(self._count_operations.get(cell.get('execution_count', None), ()))
+            if self._id_operations:
+                ops.extend(self._id_operations.get(cell.get('id', None), ()))
+            if self._tag_operations:
+                for tag in cell.get('metadata', {}).get('tags', ()):
+                    ops.extend(self._tag_operations.get(tag, ()))
+        return ops
+
+    def sequence(self, nb):
+        """Return the positions of the selected cells in rendering order"""
+        positions = self.select_positions(nb)
+        if self._order:
+            ordered = set(self._order)
+            sequence = [oi for oi in self._order if oi < len(positions)]
+            sequence.extend(oi for oi in range(len(positions)) if oi not in ordered)
         else:
-            cell_indexes = self._select_by_index or []
-        if self._select_by_count:
-            for index, cell in enumerate(nb['cells']):
-                if cell.get('execution_count', None) in self._select_by_count:
-                    cell_indexes.append(index)
-        # Add items in other
-        order = self._order or range(len(cell_indexes))
+            sequence = range(len(positions))
+        return [positions[oi] for oi in sequence]
+
+    def create_cell(self, nb, position):
+        cell = Cell(nb['cells'][position])
+        for op, value in self.operations(nb, position):
+            getattr(cell, op)(*value)
+        return cell
+
+    def create_cells(self, nb):
+        return [self.create_cell(nb, position) for position in self.sequence(nb)]
+
+    def paginate(self, page_height, style=None):
+        """Split the selected cells into Pages of at most page_height
+
+        Pages break between cells. Code cells taller than a page break
+        between their input and output blocks, and a block taller than a
+        page gets a page of its own. Cells are measured one at a time.
+        """
+        style = self.build_style(style)
+        nb = self.load()
+        pages = []
+        current, used = [], style.group_margin
+
+        def flush():
+            nonlocal current, used
+            pages.append(Page(current, len(pages) + 1, page_height, **self.kwargs))
+            current, used = [], style.group_margin
+
+        for position in self.sequence(nb):
+            cell = self.create_cell(nb, position)
+            height = cell.do_measure(style).height
+            cell.release()
+            blocks = None
+            if style.group_margin + height > page_height:
+                result = cell.create_result()
+                if isinstance(result, GroupSequence) and len(result.items) > 1:
+                    result.do_measure(style)
+                    blocks = [obj.height + sep for obj, sep in result.items]
+            if blocks is None:
+                if current and used + height > page_height:
+                    flush()
+                current.append(cell)
+                used += height
+                continue
+            start = 0
+            for i, block in enumerate(blocks):
+                if used + block > page_height and (current or i > start):
+                    if i > start:
+                        current.append(self.create_cell(nb, position))
+                        current[-1].select_blocks(start, i)
+                        start = i
+                    flush()
+                used += block
+            cell.select_blocks(start, len(blocks))
+            current.append(cell)
+        if current or not pages:
+            flush()
+        return pages
+
+    def load_items(self, prefetch=True):
+        nb = self.load()
         self.items = []
-        for oi in order:
-            if oi < len(cell_indexes):
-                index = cell_indexes[oi]
-                ec = nb['cells'][index].get('execution_count', None)
-                cell = Cell(nb['cells'][index])
-                for op, value in self._index_operations.get(index, []):
-                    getattr(cell, op)(*value)
-                for op, value in self._count_operations.get(ec, []):
-                    getattr(cell, op)(*value)
-                self.add(cell)
-        for oi in range(len(cell_indexes)):
-            if oi not in order:
-                index = cell_indexes[oi]
-                ec = nb['cells'][index].get('execution_count', None)
-                cell = Cell(nb['cells'][index])
-                for op, value in self._index_operations.get(index, []):
-                    getattr(cell, op)(*value)
-                for op, value in self._count_operations.get(ec, []):
-                    getattr(cell, op)(*value)
-                self.add(cell)
-        super().build(style)
-        
+        self.undo = {}
+        for cell in self.create_cells(nb):
+            self.add(cell)
+        if prefetch and self.prefetch_html:
+            # Rasterize all HTML outputs concurrently before the layout needs them
+            raster.RASTERIZER.prefetch([
+                html for cell, _ in self.items for html in cell.html_outputs()
+            ])
+
+    def measure(self, style):
+        self.load_items()
+        super().measure(style)
+
+    def builds_in_processes(self):
+        """Check if cells are built by other processes, each with its own rasterizer"""
+        if self.executor is not None:
+            from concurrent.futures import ProcessPoolExecutor
+            return isinstance(self.executor, ProcessPoolExecutor)
+        return bool(self.jobs and self.jobs > 1)
+
+    @contextmanager
+    def pool(self):
+        """Yield the executor that builds cells, or None to build them here"""
+        if self.executor is not None:
+            yield self.executor
+        elif self.jobs and self.jobs > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                yield executor
+        else:
+            yield None
+
+    def fragments(self, executor, style, cells):
+        """Yield the (serialized element, width, height) of cells built on executor, in order
+
+        At most a few cells per worker are in flight. Cells that fail to build
+        remotely (e.g., unpicklable replacements) yield None.
+        """
+        window = 2 * (self.jobs or os.cpu_count() or 1)
+        cells = iter(cells)
+        pending = deque(
+            executor.submit(build_fragment, cell, style) for cell in islice(cells, window)
+        )
+        while pending:
+            future = pending.popleft()
+            for cell in islice(cells, 1):
+                pending.append(executor.submit(build_fragment, cell, style))
+            try:
+                data, width, height = future.result()
+            except Exception:
+                yield None
+            else:
+                yield data, width, height
+
+    def iter_build(self, style, keep=True):
+        # Worker processes rasterize the HTML of the cells they build
+        self.load_items(prefetch=not self.builds_in_processes())
+        # Reuse the layout of cells that did not change since the last build
+        style_key = style.fingerprint()
+        previous, self._layout = self._layout, {}
+        keys, entries = [], []
+        for cell, _ in self.items:
+            key = cell.cache_key()
+            if key is not None:
+                try:
+                    key = fingerprint(key, style_key)
+                except TypeError:
+                    key = None
+            keys.append(key)
+            entries.append(previous[key].pop(0) if previous.get(key) else None)
+        with self.pool() as executor:
+            fragments = None
+            if executor is not None:
+                fragments = self.fragments(executor, style, [
+                    cell for (cell, _), entry in zip(self.items, entries) if entry is None
+                ])
+            self.height = style.group_margin
+            self.width = 0
+            for (cell, sep), key, entry in zip(self.items, keys, entries):
+                if entry is None and fragments is not None:
+                    entry = next(fragments)
+                if entry is not None:
+                    data, cell.width, cell.height = entry
+                    cell.element = etree.fromstring(data)
+                    cell.element.attrib.pop('transform', None)
+                    cell.translate(0, self.height).set_transform()
+                    cell._built = True
+                else:
+                    cell.translate(0, self.height).do_build(style)
+                    data = None
+                if keep and key is not None:
+                    # Keep the layout serialized: the built tree may be rewritten in place later
+                    if data is None:
+                        data = etree.tostring(cell.element)
+                    self._layout.setdefault(key, []).append((data, cell.width, cell.height))
+                self.height += cell.height + sep
+                self.width = max(self.width, cell.width)
+                yield cell
+
     def __repr__(self):
         return f'Notebook({self.filename!r})'
+
+
+def build_fragment(cell, style):
+    """Build a cell, possibly in another process. Return (serialized element, width, height)"""
+    cell.do_build(style)
+    return etree.tostring(cell.element), cell.width, cell.height
+
+
+class Page(GroupSequence):
+    """Standalone sequence of cells produced by Notebook.paginate
+
+    Pages are at least page_height tall and can be pickled to render them
+    in other processes.
+    """
+
+    def __init__(self, cells=(), number=1, page_height=0, **kwargs):
+        super().__init__(**kwargs)
+        self.number = number
+        self.page_height = page_height
+        for cell in cells:
+            self.add(cell)
+
+    def iter_build(self, style, keep=True):
+        yield from super().iter_build(style, keep)
+        self.height = max(self.height, self.page_height)
+
+    def measure(self, style):
+        super().measure(style)
+        self.height = max(self.height, self.page_height)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['etype']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.etype = E.g
+
+    def __repr__(self):
+        return f'Page({self.number!r}, cells={len(self.items)})'
@@ -1,24 +1,25 @@
-from lxml.html import document_fromstring
 from lxml.builder import E
 
 from .base import StylizedElement
-from .table import DataframeTable
+from .table import DataframeTable, is_dataframe
 from .image import Image, SVGGroup
 from .text import Text
 from .markdown import Markdown
 from .group import GroupSequence
+from .. import raster
 
 
 class Error(StylizedElement):
     
-    def __init__(self, error, **kwargs):
+    def __init__(self, error, elide=False, **kwargs):
         super().__init__(**kwargs)
         self.error = error
+        self.elide = elide
         
     def build(self, style):
         group = GroupSequence()
         for line in self.error.get('traceback', []):
-            group.add(Text(line))
+            group.add(Text(line, elide=self.elide))
         group = group.do_build(style)
         self.element = E.g(
             E.rect({
@@ -35,22 +36,28 @@ class Error(StylizedElement):
 
 
 def html_output(html, **kwargs):
-    dom = document_fromstring(html)
-    tables = dom.xpath("//table")
-    if tables and tables[0].attrib.get('class') == 'dataframe':
-        return DataframeTable(dom, **kwargs)
-    import imgkit
-    res = imgkit.from_string(html, False)
+    if is_dataframe(html):
+        return DataframeTable(html, **kwargs)
+    res = raster.RASTERIZER.render(html)
     return Image(res)
 
 
+def rasterized_html(data):
+    """Return the HTML of display data that display_data would rasterize"""
+    html = data.get('text/html')
+    if html is not None and not is_dataframe(html):
+        return html
+    return None
+
+
 def stream_output(data):
     if data.get('name', '') == 'stderr':
-        return Error(data['text'].split('\n'))
-    return Text(data['text'].rstrip())
+        return Error({'traceback': [data['text'].rstrip()]}, elide=True)
+    return Text(data['text'].rstrip(), elide=True)
 
 
-def display_data(data, **kwargs):
+def display_data(data, metadata=None, **kwargs):
+    metadata = metadata or {}
     if 'text/html' in data:
         return html_output(data['text/html'], **kwargs)
     if 'text/markdown' in data:
@@ -58,10 +65,10 @@ def display_data(data, **kwargs):
     if 'image/svg+xml' in data:
         return SVGGroup(data['image/svg+xml'], **kwargs)
     if 'image/png' in data:
-        return Image(data['image/png'], **kwargs)
+        return Image(data['image/png'], metadata=metadata.get('image/png'), **kwargs)
     if 'image/jpeg' in data:
-        return Image(data['image/jpeg'], **kwargs)
+        return Image(data['image/jpeg'], metadata=metadata.get('image/jpeg'), **kwargs)
     if 'text/plain' in data:
-        return Text(data['text/plain'].rstrip(), **kwargs)
+        return Text(data['text/plain'].rstrip(), elide=True, **kwargs)
     return Text(f'Unsupported mimetypes: {", ".join(data.keys())}')
     
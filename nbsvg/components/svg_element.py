@@ -1,27 +1,213 @@
+import os
+import secrets
+import tempfile
+import zlib
+
+from contextlib import contextmanager, suppress
 from lxml import etree
 from lxml.builder import E
 from .base import StylizedElement
-from .group import Group
+from .group import Group, GroupSequence
+from .image import ImageDefs
+from ..optimize import Optimizer
+
+OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+DOCTYPE = '<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.0//EN" "http://www.w3.org/TR/2001/REC-SVG-20010904/DTD/svg10.dtd">'
+
+
+def create_temporary(path):
+    """Create a new file next to path. Return its descriptor and name
+
+    Unlike mkstemp, the file gets the permissions of open(), which are
+    derived from the umask by the kernel without changing it.
+    """
+    directory, name = os.path.split(path)
+    while True:
+        temp = os.path.join(directory or '.', f'.{name}.{secrets.token_hex(8)}.tmp')
+        try:
+            return os.open(temp, OPEN_FLAGS, 0o666), temp
+        except FileExistsError:
+            continue
+
+
+class GzipStream:
+    """Write-only file wrapper that gzips data through a zlib stream"""
+
+    def __init__(self, fileobj, level=9):
+        self.fileobj = fileobj
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def write(self, data):
+        self.fileobj.write(self.compressor.compress(data))
+
+    def close(self):
+        self.fileobj.write(self.compressor.flush())
+
 
 class SVGElement(Group):
 
-    def __init__(self, **kwargs):
+    def __init__(self, dedup_images=True, **kwargs):
         super().__init__(**kwargs)
         self.etype = lambda: E.svg({'xmlns': 'http://www.w3.org/2000/svg'})
+        self.dedup_images = dedup_images
+        self._optimizer = None
+        self._images = None
 
     def build(self, style):
         super().build(style)
+        self.finish_root()
+
+    def emit(self, style):
+        super().emit(style)
+        self.finish_root()
+
+    def finish_root(self):
         self.element.set('width', f'{self.width}')
         self.element.set('height', f'{self.height}')
 
+    @contextmanager
+    def shared_images(self):
+        """Swap the embedded images of the tree for <use>s of <defs> symbols
+
+        Components keep their trees after a build, so the <image>s are put
+        back on exit instead of rewriting (or copying) the tree for good.
+        """
+        if not self.dedup_images:
+            yield
+            return
+        images = ImageDefs()
+        pairs = images.uses(self.element)
+        for image, use in pairs:
+            image.getparent().replace(image, use)
+        defs = images.defs()
+        if defs is not None:
+            self.element.insert(0, defs)
+        try:
+            yield
+        finally:
+            if defs is not None:
+                self.element.remove(defs)
+            for image, use in pairs:
+                use.getparent().replace(use, image)
+
     @property
     def xml(self):
         if not self._built:
             self.do_build()
-        return etree.tostring(
-            self.element, xml_declaration=True, encoding="UTF-8", method="html",
-            doctype='<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.0//EN" "http://www.w3.org/TR/2001/REC-SVG-20010904/DTD/svg10.dtd">'
-        )
+        with self.shared_images():
+            return etree.tostring(
+                self.element, xml_declaration=True, encoding="UTF-8", method="html",
+                doctype=DOCTYPE
+            )
+
+    def optimize(self, precision=2, **kwargs):
+        """Shrink the built tree in place. Return the bytes before and after"""
+        if not self._built:
+            self.do_build()
+        return Optimizer(precision=precision, **kwargs).optimize(self.element)
+
+    def write(self, fileobj, style=None, compress=None, chunk_size=1 << 16, optimize=None):
+        """Write the SVG incrementally to a path or a binary file object
+
+        Each cell is serialized as soon as it is laid out and its tree is
+        dropped afterwards. Since the root size is only known at the end,
+        the body goes through a temporary file first.
+        Paths ending with .svgz are gzip compressed unless compress is given.
+        A path is only replaced once the whole SVG is written, so a failed
+        build leaves no partial file behind.
+        optimize may be True or an Optimizer; each cell then goes through it
+        and the report of bytes saved is returned.
+        """
+        if isinstance(fileobj, (str, os.PathLike)):
+            path = os.fspath(fileobj)
+            if compress is None:
+                compress = path.endswith('.svgz')
+            fd, temp = create_temporary(path)
+            try:
+                with os.fdopen(fd, 'wb') as fil:
+                    report = self.write(
+                        fil, style=style, compress=compress, chunk_size=chunk_size, optimize=optimize
+                    )
+                os.replace(temp, path)
+            except BaseException:
+                with suppress(OSError):
+                    os.unlink(temp)
+                raise
+            return report
+        if optimize is True:
+            optimize = Optimizer()
+        self._optimizer = optimize or None
+        self._images = ImageDefs() if self.dedup_images else None
+        style = self.build_style(style)
+        output = GzipStream(fileobj) if compress else fileobj
+        with tempfile.TemporaryFile() as body:
+            with etree.xmlfile(body, encoding='UTF-8') as xf:
+                with xf.element('g'):
+                    self.height = self.width = 0
+                    for item in self.items:
+                        self.write_item(xf, item, style)
+                        self.height = max(self.height, item.y + item.height)
+                        self.width = max(self.width, item.x + item.width)
+            element = self.etype()
+            element.set('width', f'{self.width}')
+            element.set('height', f'{self.height}')
+            if self.x != 0 or self.y != 0:
+                element.set('transform', f'translate({self.x}, {self.y})')
+            # Reuse lxml to serialize the root start tag: <svg ...></svg>
+            if self._optimizer is not None:
+                self._optimizer.round(element)
+            root = etree.tostring(element, method="html")
+            output.write(f'{DOCTYPE}\n'.encode('utf-8'))
+            output.write(root[:-len(b'</svg>')])
+            css = self._optimizer.style_element() if self._optimizer is not None else None
+            if css is not None:
+                css = etree.tostring(css, method="html")
+                self._optimizer.after += len(css)
+                output.write(css)
+            # Copy the body without its <g></g> wrapper
+            size = body.tell() - len(b'<g>') - len(b'</g>')
+            body.seek(len(b'<g>'))
+            while size > 0:
+                data = body.read(min(chunk_size, size))
+                output.write(data)
+                size -= len(data)
+            defs = self._images.defs() if self._images is not None else None
+            if defs is not None:
+                output.write(etree.tostring(defs, method="html"))
+            output.write(b'</svg>')
+        if compress:
+            output.close()
+        self.element = None
+        self._built = False
+        self._optimizer = None
+        self._images = None
+        if optimize:
+            return optimize.report()
+
+    def write_item(self, xf, item, style):
+        if isinstance(item, GroupSequence):
+            item_style = item.build_style(style)
+            element = item.etype()
+            if item.x != 0 or item.y != 0:
+                element.set('transform', f'translate({item.x}, {item.y})')
+            with xf.element(element.tag, dict(element.attrib)):
+                for child in item.iter_build(item_style, keep=False):
+                    xf.write(self.finish(child.element), method="html")
+                    xf.flush()
+                    child.release()
+        else:
+            element = self.finish(item.do_build(style).element)
+            xf.write(element, method="html")
+            xf.flush()
+            item.release()
+
+    def finish(self, element):
+        """Apply the post-build passes of write to a subtree"""
+        if self._images is not None:
+            element = self._images.process(element)
+        if self._optimizer is not None:
+            self._optimizer.process(element)
+        return element
 
     def __repr__(self):
         return f'SVGElement(items={self.items})'
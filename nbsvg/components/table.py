@@ -1,3 +1,4 @@
+import re
 import textwrap
 
 from lxml.builder import E
@@ -5,39 +6,184 @@ from lxml import etree
 
 from .base import StylizedElement
 
-def extract_df_data(dom):
-    table = dom.xpath("//table")[0]
-    header_rows = [i for i, _ in enumerate(table.xpath("//thead/tr"))]
-
-    table_data = []
-    for row in table.xpath('//tr'):
-        table_row = []
-        for col in row.xpath('th | td'):
-            text = col.text or ''
-            table_row.append({
-                'value': text,
-                'bold': col.tag == 'th',
-                'lines': [text]
-            })
-        table_data.append(table_row)
-
-    p_data = None
-    findp = dom.xpath("//p")
-    if findp:
-        p_data = findp[0].text
-    return header_rows, table_data, p_data
+ELLIPSIS = '\u22ef'
+DATAFRAME_TABLE = re.compile(r'<table\b[^>]*>', re.IGNORECASE)
+TABLE_END = re.compile(r'</table\s*>', re.IGNORECASE)
+TABLE_ROW = re.compile(r'<tr\b', re.IGNORECASE)
+CLASS_ATTRIBUTE = re.compile(r"""\bclass\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE)
 
 
-def get_column_sizes(table_data, style):
-    max_col_size = [style.table_colpadding] * len(table_data[0])
-    for row in table_data:
-        for i, col in enumerate(row):
-            for line in col['lines']:
-                max_col_size[i] = max(
-                    max_col_size[i],
-                    style.getsizeintable(line, col['bold'])
+def is_dataframe(html):
+    """Check if the first table of the html is a pandas dataframe without parsing it"""
+    match = DATAFRAME_TABLE.search(html)
+    if match is None:
+        return False
+    attribute = CLASS_ATTRIBUTE.search(match.group())
+    if attribute is None:
+        return False
+    return next(group for group in attribute.groups() if group is not None) == 'dataframe'
+
+
+def count_rows(html):
+    """Count the rows of the first table of the html without parsing it"""
+    start = DATAFRAME_TABLE.search(html)
+    if start is None:
+        return 0
+    end = TABLE_END.search(html, start.end())
+    return len(TABLE_ROW.findall(html, start.end(), end.start() if end else len(html)))
+
+
+def ellipsis_col():
+    return {'value': ELLIPSIS, 'bold': False, 'lines': [ELLIPSIS]}
+
+
+def elide(items, limit, head, tail, filler):
+    if limit is None or len(items) <= limit:
+        return items
+    return items[:head] + [filler()] + (items[len(items) - tail:] if tail else [])
+
+
+def iter_html_events(html, chunk_size=65536):
+    parser = etree.HTMLPullParser(events=('start', 'end'))
+    for position in range(0, len(html), chunk_size):
+        parser.feed(html[position:position + chunk_size])
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+def extract_row(element):
+    return [
+        {'value': col.text or '', 'bold': col.tag == 'th', 'lines': [col.text or '']}
+        for col in element if col.tag in ('th', 'td')
+    ]
+
+
+def extract_df_data(html, style):
+    """Parse the first table of a dataframe html incrementally
+
+    Body rows beyond style.table_max_rows are elided: only the first
+    table_head_rows and the last table_tail_rows are converted, with an
+    ellipsis row between them. Columns are elided in the same way.
+    """
+    max_rows, head_rows, tail_rows = style.table_max_rows, style.table_head_rows, style.table_tail_rows
+    body_total = count_rows(html)
+    header_rows, table_data, p_data = [], [], None
+    body_index = 0
+    state = 'before'
+    for event, element in iter_html_events(html):
+        tag = element.tag
+        if event == 'start':
+            if tag == 'table' and state == 'before':
+                state = 'table'
+            continue
+        if tag == 'p' and p_data is None:
+            p_data = element.text or ''
+        elif state != 'table':
+            if state == 'after' and p_data is not None:
+                break
+            continue
+        elif tag == 'table':
+            state = 'after'
+        elif tag == 'tr':
+            parent = element.getparent()
+            if parent is not None and parent.tag == 'thead':
+                header_rows.append(len(table_data))
+                table_data.append(extract_row(element))
+                body_total -= 1
+            else:
+                elided = max_rows is not None and body_total > max_rows and (
+                    head_rows <= body_index < body_total - tail_rows
                 )
-    return max_col_size
+                if not elided:
+                    table_data.append(extract_row(element))
+                elif body_index == head_rows:
+                    table_data.append(None)
+                body_index += 1
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+    ncols = max((len(row) for row in table_data if row is not None), default=0)
+    return header_rows, [
+        elide(
+            [ellipsis_col() for _ in range(ncols)] if row is None else row,
+            style.table_max_cols, style.table_head_cols, style.table_tail_cols, ellipsis_col
+        )
+        for row in table_data
+    ], p_data
+
+
+class TableColumns(object):
+    """Column-major model of the lines of a table
+
+    Each column keeps a flat list of its lines, the boldness of each line
+    and the number of lines in each row. Widths of all lines are measured
+    with one textwidths call per font weight.
+    """
+
+    def __init__(self, table_data):
+        ncols = len(table_data[0])
+        self.lines = [[] for _ in range(ncols)]
+        self.bold = [[] for _ in range(ncols)]
+        self.counts = [[] for _ in range(ncols)]
+        self.sizes = [None] * ncols
+        self.load(table_data, range(ncols))
+
+    def load(self, table_data, columns):
+        for j in columns:
+            lines, bold, counts = self.lines[j], self.bold[j], self.counts[j]
+            del lines[:], bold[:], counts[:]
+            for row in table_data:
+                if j >= len(row):
+                    counts.append(0)
+                    continue
+                col = row[j]
+                lines.extend(col['lines'])
+                bold.extend([col['bold']] * len(col['lines']))
+                counts.append(len(col['lines']))
+            self.sizes[j] = None
+
+    def column_sizes(self, style):
+        pending = [j for j, size in enumerate(self.sizes) if size is None]
+        if pending:
+            widest = {j: None for j in pending}
+            for weight in (False, True):
+                texts, owners = [], []
+                for j in pending:
+                    selected = [line for line, bold in zip(self.lines[j], self.bold[j]) if bold == weight]
+                    texts.extend(selected)
+                    owners.extend([j] * len(selected))
+                if texts:
+                    for j, width in column_maxima(owners, style.tablewidths(texts, weight)):
+                        if widest[j] is None or width > widest[j]:
+                            widest[j] = width
+            for j, width in widest.items():
+                self.sizes[j] = style.table_colpadding
+                if width is not None:
+                    self.sizes[j] = max(style.table_colpadding, width + style.table_colpadding)
+        return list(self.sizes)
+
+
+def column_maxima(owners, widths):
+    """Yield (column, widest line) pairs for lines grouped by column"""
+    try:
+        import numpy as np
+    except ImportError:
+        widest = {}
+        for owner, width in zip(owners, widths):
+            if owner not in widest or width > widest[owner]:
+                widest[owner] = width
+        yield from widest.items()
+        return
+    owners = np.asarray(owners)
+    widths = np.asarray(widths, dtype=float)
+    starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    yield from zip(owners[starts].tolist(), np.maximum.reduceat(widths, starts).tolist())
+
+
+def get_column_sizes(table_data, style):
+    return TableColumns(table_data).column_sizes(style)
 
 
 class Table(StylizedElement):
@@ -49,7 +195,7 @@ class Table(StylizedElement):
         self.rcol = rcol
         self.rdata = rdata
 
-    def build(self, style):
+    def measure(self, style, columns=None):
         table_data = self.table_data
         header_rows = self.header_rows
 
@@ -61,11 +207,28 @@ class Table(StylizedElement):
             else:
                 table_data[i][j] = value
 
-        
-        col_sizes = get_column_sizes(table_data, style)
+        if columns is None:
+            columns = TableColumns(table_data)
+        elif self.rdata:
+            columns.load(table_data, {j for _, j in self.rdata})
+        col_sizes = columns.column_sizes(style)
         for key, value in self.rcol.items():
             col_sizes[key] = value
-        
+
+        ystep = style.table_fontsize + 5
+        self.width = sum(col_sizes) + 5
+        row_lines = [max(counts) for counts in zip(*columns.counts)]
+        self.height = 5
+        for i, max_lines in enumerate(row_lines):
+            self.height += max_lines * ystep
+            if i == header_rows[-1]:
+                self.height += 1
+        self._layout = col_sizes, row_lines
+
+    def emit(self, style):
+        table_data = self.table_data
+        header_rows = self.header_rows
+        col_sizes, row_lines = self._layout
         fontsize = style.table_fontsize
         self.element = E.g({
             'font-family': f'{style.table_fontfamily}', 
@@ -73,15 +236,14 @@ class Table(StylizedElement):
         })
         spacehack = False
         ystep = fontsize + 5
-        
-        self.width = sum(col_sizes) + 5
-        
+
         dy = 5
+        headers = set(header_rows)
         for i, row in enumerate(table_data):
-            max_lines = max(len(col['lines']) for col in row)
+            max_lines = row_lines[i]
             total_height = max_lines * ystep
             dx = 0
-            if i % 2 == 0 and i not in header_rows:
+            if i % 2 == 0 and i not in headers:
                 self.element.append(E.rect({
                    'x': '0', 'y': f'{dy}', 'fill': 'rgb(245, 245, 245)', 
                    'height': f'{total_height}', 'width': f'{self.width}'
@@ -93,12 +255,12 @@ class Table(StylizedElement):
                 for yi, line in enumerate(col['lines']):
                     if spacehack:
                         line = line.expandtabs().replace(' ', '&#160;')
-                    self.element.append(E.text(
-                        E.tspan(line, {'fill': 'black'}),
-                        {'x': f'{dx}', 'y': f'{fontsize + py + ystep * yi}', 
-                         '{http://www.w3.org/XML/1998/namespace}space': 'preserve',
-                         'text-anchor': 'end', 'font-weight': 'bold' if col['bold'] else 'normal'}
-                    ))
+                    text = etree.SubElement(self.element, 'text', {
+                        'x': f'{dx}', 'y': f'{fontsize + py + ystep * yi}',
+                        '{http://www.w3.org/XML/1998/namespace}space': 'preserve',
+                        'text-anchor': 'end', 'font-weight': 'bold' if col['bold'] else 'normal'
+                    })
+                    etree.SubElement(text, 'tspan', {'fill': 'black'}).text = line
                 
             dy += total_height
             if i == header_rows[-1]:
@@ -107,7 +269,7 @@ class Table(StylizedElement):
                    'height': '1', 'width': f'{self.width}'
                 }))
                 dy += 1
-        self.height = dy
+        self._layout = None
 
     def __repr__(self):
         return f'Table({self.table_data!r}, {self.header_rows!r}, rcol={self.rcol!r})'
@@ -119,16 +281,20 @@ class WrapTable(Table):
         super().__init__(table_data, header_rows, rcol=rcol, rdata=rdata, **kwargs)
         self.rlen = rlen
 
-    def build(self, style):
-        wraplen = {**self.wrap_columns(style), **self.rlen}
+    def measure(self, style):
+        columns = TableColumns(self.table_data)
+        wraplen = {**self.wrap_columns(style, columns.column_sizes(style)), **self.rlen}
         for row in self.table_data:
             for j, col in enumerate(row):
                 if j in wraplen:
                     col['lines'] = textwrap.wrap(col['value'], width=wraplen[j])
-        super().build(style)
+        # rlen may name columns that the table does not have
+        columns.load(self.table_data, [j for j in range(len(columns.lines)) if j in wraplen])
+        super().measure(style, columns)
 
-    def wrap_columns(self, style):
-        col_sizes = get_column_sizes(self.table_data, style)
+    def wrap_columns(self, style, col_sizes=None):
+        if col_sizes is None:
+            col_sizes = get_column_sizes(self.table_data, style)
         avg_col_size = style.width / len(col_sizes)
         undersized_cols = sum(avg_col_size - x for x in col_sizes if x < avg_col_size)
         oversized_cols = [i for i, x in enumerate(col_sizes) if x > avg_col_size]
@@ -146,23 +312,34 @@ class WrapTable(Table):
 
 class DataframeTable(StylizedElement):
     
-    def __init__(self, dom, **kwargs):
+    def __init__(self, html, **kwargs):
         super().__init__(**kwargs)
-        self.dom = dom
+        if not isinstance(html, str):
+            # Parsed lxml documents are parsed again incrementally, as text
+            html = etree.tostring(html, encoding='unicode', method='html')
+        self.html = html
 
-    def build(self, style):
-        header_rows, table_data, p_data = extract_df_data(self.dom)
-        table = WrapTable(table_data, header_rows, **self.kwargs).do_build(style)
+    def cache_key(self):
+        return self.html
+
+    def measure(self, style):
+        header_rows, table_data, self._p_data = extract_df_data(self.html, style)
+        self._table = WrapTable(table_data, header_rows, **self.kwargs).do_measure(style)
+        self.width = self._table.width
+        self.height = self._table.height
+        if self._p_data:
+            self.height += style.table_fontsize + 5
+
+    def emit(self, style):
+        table, p_data = self._table.do_emit(), self._p_data
         self.element = table.element
-        self.width = table.width
-        self.height = table.height
         if p_data:
             self.element.append(E.text(
                 etree.XML(f'<tspan fill="black">{p_data}</tspan>'),
                 {'x': '0', 'y': f'{style.table_fontsize + table.height}', 
                 '{http://www.w3.org/XML/1998/namespace}space': 'preserve'}
             ))
-            self.height += style.table_fontsize + 5
+        self._table = self._p_data = None
 
     def __repr__(self):
-        return f'DataframeTable({self.dom!r})'
+        return f'DataframeTable({self.html[:80]!r})'
@@ -1,71 +1,109 @@
 import re
 import textwrap
 
-from itertools import zip_longest
-
 from lxml import etree
 from lxml.builder import E
 from .base import StylizedElement
 from .group import GroupSequence
+from ..ansi import AnsiState
+
+def elide_lines(text, max_lines, head_lines, tail_lines):
+    """Keep the first head_lines and the last tail_lines of a long text
+
+    Lines are found with count/find/rfind, so the omitted middle is never
+    split into a list. When head_lines + tail_lines exceeds max_lines, both
+    shrink proportionally, so at most max_lines lines and the marker remain.
+    """
+    if max_lines is None:
+        return text
+    total = text.count('\n') + 1
+    if total <= max_lines:
+        return text
+    if head_lines + tail_lines > max_lines:
+        head_lines = max_lines * head_lines // (head_lines + tail_lines)
+        tail_lines = max_lines - head_lines
+    if head_lines + tail_lines >= total:
+        return text
+    parts = []
+    if head_lines:
+        end = -1
+        for _ in range(head_lines):
+            end = text.find('\n', end + 1)
+        parts.append(text[:end])
+    parts.append(f'\u2026 {total - head_lines - tail_lines} lines omitted \u2026')
+    if tail_lines:
+        start = len(text)
+        for _ in range(tail_lines):
+            start = text.rfind('\n', 0, start)
+        parts.append(text[start + 1:])
+    return '\n'.join(parts)
+
 
 class Text(StylizedElement):
     
-    def __init__(self, text, color='black', **kwargs):
+    def __init__(self, text, color='black', elide=False, **kwargs):
         super().__init__(**kwargs)
         self.text = text
         self.color = color
+        self.elide = elide
+
+    def lines(self, style):
+        text = self.text
+        if self.elide:
+            text = elide_lines(
+                text, style.output_max_lines, style.output_head_lines, style.output_tail_lines
+            )
+        return text.split('\n')
 
     def build(self, style):
+        # Single pass: each line is parsed, measured and emitted at once
         fontsize = style.fontsize
         self.element = E.g({
             'font-family': f'{style.fontfamily}', 
             'font-size': f'{fontsize}'
         })
-        #spacehack = True
         ystep = fontsize + 5
-        lines = self.text.split('\n')
+        state = AnsiState(self.color)
+        lines = self.lines(style)
         self.width = 0
         for yi, line in enumerate(lines):
-            self.width = max(self.width, len(line) * fontsize * style.fontwidth_proportion)
-            #if spacehack:
-            #    line = line.expandtabs().replace(' ', '&#160;')
-            self.element.append(E.text(
-                *self.interp_ansi(line),
-                {'x': '0', 'y': f'{fontsize + ystep * yi}', 'text-anchor': style.textanchor,
-                 '{http://www.w3.org/XML/1998/namespace}space': 'preserve'}
-            ))
+            runs = state.runs(line)
+            self.width = max(self.width, style.textwidth(''.join(value for value, _ in runs)))
+            text = etree.SubElement(self.element, 'text', {
+                'x': '0', 'y': f'{fontsize + ystep * yi}', 'text-anchor': style.textanchor,
+                '{http://www.w3.org/XML/1998/namespace}space': 'preserve'
+            })
+            for value, attr in runs:
+                etree.SubElement(text, 'tspan', attr).text = value
         self.height = len(lines) * ystep
+
+    def measure(self, style):
+        state = AnsiState(self.color)
+        self._lines = self.lines(style)
+        self.width = 0
+        for line in self._lines:
+            self.width = max(self.width, style.textwidth(''.join(value for value, _ in state.runs(line))))
+        self.height = len(self._lines) * (style.fontsize + 5)
+
+    def emit(self, style):
+        fontsize = style.fontsize
+        self.element = E.g({
+            'font-family': f'{style.fontfamily}', 
+            'font-size': f'{fontsize}'
+        })
+        ystep = fontsize + 5
+        state = AnsiState(self.color)
+        for yi, line in enumerate(self._lines):
+            text = etree.SubElement(self.element, 'text', {
+                'x': '0', 'y': f'{fontsize + ystep * yi}', 'text-anchor': style.textanchor,
+                '{http://www.w3.org/XML/1998/namespace}space': 'preserve'
+            })
+            for value, attr in state.runs(line):
+                etree.SubElement(text, 'tspan', attr).text = value
+        self._lines = None
         
     def interp_ansi(self, line):
-        intensity_map = {
-            0: {},
-            1: {'font-weight': 'bold'},
-        }
-        color_map = {
-            30: {'fill': 'black'}, # black
-            0: {'fill': self.color}, # black
-            31: {'fill': 'rgb(187, 0, 0)'}, # red
-            32: {'fill': 'rgb(0, 187, 0)'}, # green
-            33: {'fill': 'rgb(187, 187, 0)'}, # yellow
-            34: {'fill': 'rgb(0, 0, 187)'}, # blue
-            35: {'fill': 'rgb(187, 0, 187)'}, # magenta
-            36: {'fill': 'rgb(0, 187, 187)'}, # cyan
-            37: {'fill': 'rgb(187, 187, 187)'}, # white
-        }
-
-        parse = re.split(r'\x1b\[([0-9;]*)m',line)
-        it = iter(parse)
-        result = [E.tspan(next(it), {'fill': self.color})]
-
-        for control, text in zip_longest(it, it):
-            control = list(map(int, control.split(';')))
-            control = [0] * (2 - len(control)) + control
-            intensity, color = control
-            attr = {**intensity_map.get(intensity, {}), 
-                    **color_map.get(color, {'fill': self.color})}
-            result.append(E.tspan(text, attr))
-        
-        return result
+        return [E.tspan(text, attr) for text, attr in AnsiState(self.color).runs(line)]
 
     def __repr__(self):
         return f'Text({self.text!r})'
@@ -77,11 +115,16 @@ class CodeSpan(StylizedElement):
         super().__init__(**kwargs)
         self.text = text
 
-    def build(self, style):
+    def measure(self, style):
         text = self.text
         if isinstance(text, str):
             text = Text(text)
-        text = text.do_build(style)
+        self._text = text.do_measure(style)
+        self.width = text.width
+        self.height = text.height
+
+    def emit(self, style):
+        text = self._text.do_emit()
         self.element = E.g(
             E.rect({
                 'x': '0', 'y': '0', 'width': f'{text.width}', 'height': f'{text.height}',
@@ -89,8 +132,7 @@ class CodeSpan(StylizedElement):
             }),
             text.element
         )
-        self.width = text.width
-        self.height = text.height
+        self._text = None
         
     def __repr__(self):
         return f'CodeSpan({self.text!r})'
@@ -103,10 +145,20 @@ class Line(StylizedElement):
         self.tspans = tspans
         self.extra = extra
         
-    def build(self, style):
+    def measure(self, style):
         self.width = 0
         self.height = style.fontsize
-        
+        for tspan in self.tspans:
+            if isinstance(tspan, TSpan):
+                tspan.do_measure(style)
+            else:
+                tspan.translate(self.width, -style.fontsize, add=True).do_measure(style)
+                self.width += tspan.width
+            self.width += tspan.width
+            self.height = max(self.height, tspan.height)
+        self.height += 5
+
+    def emit(self, style):
         self.element = E.g({
             'font-family': f'{style.fontfamily}', 
             'font-size': f'{style.fontsize}', **self.extra
@@ -116,30 +168,25 @@ class Line(StylizedElement):
             '{http://www.w3.org/XML/1998/namespace}space': 'preserve'
         })
         added = False
+        width = 0
         for tspan in self.tspans:
             if isinstance(tspan, TSpan):
                 added = True
-                tspan = tspan.do_build(style)
-                text.append(tspan.element)
+                text.append(tspan.do_emit().element)
             else:
                 if added:
                     self.element.append(text)
-                tspan = tspan.translate(self.width, -style.fontsize, add=True).do_build(style)
-                self.width += tspan.width
+                width += tspan.width
                 if added:
                     text = E.text({
-                        'x': f'{self.width}', 'y': '0', 
+                        'x': f'{width}', 'y': '0', 
                         '{http://www.w3.org/XML/1998/namespace}space': 'preserve'
                     })
                     added = False
-                self.element.append(tspan.element)
-            self.width += tspan.width
-            self.height = max(self.height, tspan.height)
+                self.element.append(tspan.do_emit().element)
+            width += tspan.width
         if added:
             self.element.append(text)
-    
-        
-        self.height += 5
         
     def __repr__(self):
         return f'Line({self.tspans!r}, extra={self.extra})'
@@ -152,9 +199,11 @@ class TSpan(StylizedElement):
         self.text = text
         self.attr = attr
         
-    def build(self, style):
-        self.width = len(self.text) * style.fontsize * style.fontwidth_proportion
+    def measure(self, style):
+        self.width = style.textwidth(self.text)
         self.height = style.fontsize
+
+    def emit(self, style):
         self.element = E.tspan(self.text, self.attr)
 
     def __repr__(self):
@@ -197,45 +246,122 @@ def breakgroup(line, pos=0, result="", attrib={}, mappos=[], mapattr=[]):
     return pos, result, mappos, mapattr
 
 
-def breakgroup_to_lines(line, width):
-    pos, result, mappos, mapattr = breakgroup(line)
-    lines = textwrap.wrap(result, width=width, drop_whitespace=False)
-    nexti = 1
-    cpos = mappos[0]
-    cattr = mapattr[0]
-    npos = mappos[nexti]
-    remaining = npos - cpos
-    new_lines = GroupSequence()
-    for line in lines:
-        new_line = GroupSequence()
-        nline = line.lstrip(' ')
-        cpos += len(line) - len(nline)
-        remaining = npos - cpos
-        line = nline
-        linesize = len(line)
-        while linesize > remaining:
-            subline = line[:remaining]
-            if subline == "\1":
-                new_line.add(cattr)
-            else:
-                new_line.add(TSpan(subline, cattr))
-            linesize -= len(subline)
-            line = line[remaining:]
-            cpos += len(subline)
-            cattr = mapattr[nexti]
-            nexti += 1
-            npos = mappos[nexti]
-            remaining = npos - cpos
-        if remaining >= linesize:
-            subline = line
-            if subline == "\1":
-                new_line.add(cattr)
-            else:
-                new_line.add(TSpan(subline, cattr))
-            cpos += len(subline)
-            remaining = npos - cpos
-        new_lines.add(new_line)
-    return new_lines
+WORD = re.compile(r'\S+|\s+')
+
+
+def measure_box(item, style):
+    if isinstance(item, CodeSpan) and isinstance(item.text, str):
+        return max(style.textwidth(line) for line in item.text.split('\n'))
+    return item.do_measure(style).width
+
+
+def split_word(word, limit, style, bold):
+    """Split a word wider than limit into chunks at character boundaries"""
+    chunks, chunk, chunk_width = [], [], 0
+    for attr, content, width in word:
+        if not isinstance(content, str):
+            parts = [(content, width)]
+        else:
+            itembold = bold or attr.get('font-weight') == 'bold'
+            parts = [(char, style.textwidth(char, bold=itembold)) for char in content]
+        for part, part_width in parts:
+            if chunk and chunk_width + part_width > limit:
+                chunks.append((chunk, chunk_width))
+                chunk, chunk_width = [], 0
+            chunk.append((attr, part, part_width))
+            chunk_width += part_width
+    chunks.append((chunk, chunk_width))
+    return chunks
+
+
+def line_group(pieces):
+    """Merge adjacent text pieces that share attributes into TSpans"""
+    group = GroupSequence()
+    text, current = [], None
+    for attr, content, _ in pieces:
+        if isinstance(content, str) and text and attr == current:
+            text.append(content)
+            continue
+        if text:
+            group.add(TSpan(''.join(text), current))
+            text = []
+        if isinstance(content, str):
+            text, current = [content], attr
+        else:
+            group.add(content)
+    if text:
+        group.add(TSpan(''.join(text), current))
+    return group
+
+
+def measure_pieces(pieces, style):
+    """Measure text pieces with one textwidths call per font weight"""
+    widths = [0] * len(pieces)
+    for weight in (False, True):
+        indexes = [
+            i for i, (attr, content, bold) in enumerate(pieces)
+            if bold == weight and isinstance(content, str)
+        ]
+        if indexes:
+            measured = style.textwidths([pieces[i][1] for i in indexes], bold=weight)
+            for i, width in zip(indexes, measured):
+                widths[i] = width
+    for i, (attr, content, bold) in enumerate(pieces):
+        if not isinstance(content, str):
+            widths[i] = measure_box(content, style)
+    return widths
+
+
+def break_lines(line, limit, style, bold=False):
+    """Break TSpans and inline boxes into lines no wider than limit
+
+    Text is split at whitespace and all pieces are measured at once with
+    style.textwidths. Other elements, such as CodeSpan, are unbreakable boxes
+    glued to the adjacent text. Lines are filled greedily in a single pass.
+    """
+    pieces = []
+    for item in line:
+        if not isinstance(item, TSpan):
+            pieces.append((None, item, None))
+            continue
+        itembold = bold or item.attr.get('font-weight') == 'bold'
+        pieces.extend((item.attr, text, itembold) for text in WORD.findall(item.text))
+
+    words = []
+    space, space_width, word, word_width = [], 0, [], 0
+    for (attr, content, _), width in zip(pieces, measure_pieces(pieces, style)):
+        if not isinstance(content, str) or not content[0].isspace():
+            word.append((attr, content, width))
+            word_width += width
+            continue
+        if word:
+            words.append((space, space_width, word, word_width))
+            space, space_width, word, word_width = [], 0, [], 0
+        space.append((attr, ' ' * len(content), width))
+        space_width += width
+    if word:
+        words.append((space, space_width, word, word_width))
+
+    limit += 1e-6
+    lines = GroupSequence()
+    current, current_width = [], 0
+    for space, space_width, word, word_width in words:
+        if current and current_width + space_width + word_width > limit:
+            lines.add(line_group(current))
+            current, current_width = [], 0
+        if current:
+            current.extend(space)
+            current_width += space_width
+        elif word_width > limit:
+            *chunks, (word, word_width) = split_word(word, limit, style, bold)
+            for chunk, _ in chunks:
+                lines.add(line_group(chunk))
+        current.extend(word)
+        current_width += word_width
+    if current:
+        lines.add(line_group(current))
+    return lines
+
 
 def flat_tspan(text, attr={}):
     if isinstance(text, GroupSequence):
@@ -293,7 +419,7 @@ def breaktext_to_lines(text, width):
     pos, result, mappos, mapattr = breaktext(text_e, attrib={'fill': 'black'})
     mappos.append(pos)
     mapattr.append({})
-    lines = textwrap.wrap(result, width=15, drop_whitespace=False)
+    lines = textwrap.wrap(result, width=width, drop_whitespace=False)
     nexti = 1
     cpos = mappos[0]
     cattr = mapattr[0]
@@ -0,0 +1,111 @@
+"""Syntax highlighting that builds SVG elements straight from Pygments tokens
+
+It produces the same elements as pygments' SvgFormatter(nowrap=True) parsed
+back with lxml, without the string round trip.
+"""
+import re
+import threading
+
+from copy import copy
+from functools import lru_cache
+
+from lxml.etree import Element, SubElement
+
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_lexers = threading.local()
+
+
+def get_lexer(lexer):
+    """Return a reusable lexer instance for a lexer class"""
+    cache = getattr(_lexers, 'cache', None)
+    if cache is None:
+        cache = _lexers.cache = {}
+    instance = cache.get(lexer)
+    if instance is None:
+        instance = cache[lexer] = lexer()
+    return instance
+
+
+class TokenStyles(dict):
+    """Lookup table from token types to tspan templates for a pygments style
+
+    Unstyled tokens map to None. Copying a template is cheaper than creating
+    a new element with attributes for every token.
+    """
+
+    def __init__(self, pygments_style):
+        super().__init__()
+        self.pygments_style = pygments_style
+
+    def __missing__(self, ttype):
+        tokentype = ttype
+        while not self.pygments_style.styles_token(tokentype):
+            tokentype = tokentype.parent
+        value = self.pygments_style.style_for_token(tokentype)
+        attr = {}
+        if value['color']:
+            attr['fill'] = '#' + value['color']
+        if value['bold']:
+            attr['font-weight'] = 'bold'
+        if value['italic']:
+            attr['font-style'] = 'italic'
+        template = Element('tspan', attr) if attr else None
+        self[ttype] = template
+        return template
+
+
+@lru_cache(maxsize=None)
+def token_styles(pygments_style):
+    return TokenStyles(pygments_style)
+
+
+def line_offsets(fontsize):
+    """Return the (yoffset, ystep) pair that SvgFormatter uses for a font size"""
+    try:
+        size = int(f'{fontsize}'.strip())
+    except ValueError:
+        size = 20
+    return size, size + 5
+
+
+def highlight(text, lexer, pygments_style, fontsize):
+    """Return a <g> with one <text> per line of highlighted code"""
+    yoffset, ystep = line_offsets(fontsize)
+    styles = token_styles(pygments_style)
+    group = Element('g')
+    y = yoffset
+    line = SubElement(group, 'text', {'x': '0', 'y': f'{y}', XML_SPACE: 'preserve'})
+    last = last_template = None
+    for ttype, value in get_lexer(lexer).get_tokens(text):
+        template = styles[ttype]
+        if '\t' in value:
+            value = value.expandtabs()
+        value = value.replace(' ', '\xa0')
+        if INVALID_XML.search(value):
+            value = INVALID_XML.sub('', value)
+        parts = value.split('\n') if '\n' in value else (value,)
+        for index, part in enumerate(parts):
+            if index:
+                y += ystep
+                line.tail = '\n'
+                line = SubElement(group, 'text', {'x': '0', 'y': f'{y}', XML_SPACE: 'preserve'})
+                last = last_template = None
+            if not part:
+                continue
+            if template is None:
+                last_template = None
+                if last is None:
+                    line.text = (line.text or '') + part
+                else:
+                    last.tail = (last.tail or '') + part
+            elif template is last_template:
+                # Adjacent runs with the same style share a single tspan
+                last.text += part
+            else:
+                last = copy(template)
+                last.text = part
+                line.append(last)
+                last_template = template
+    return group
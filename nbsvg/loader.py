@@ -0,0 +1,241 @@
+"""Notebook loading
+
+read_notebook(filename) uses nbformat with full validation. With
+validate=False it indexes the JSON document instead: a single scan
+records where each cell and each cell field starts and ends, and fields
+are only decoded (with orjson when available) when they are accessed.
+Outputs of cells that are never selected are never decoded.
+"""
+import hashlib
+import json
+import re
+
+from collections.abc import Mapping
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STRUCTURE = re.compile(rb'[\[\]{}:,"]')
+LIST, OBJECT, END_LIST, END_OBJECT, COMMA, QUOTE, BACKSLASH = b'[{]},"\\'
+OPENING = (LIST, OBJECT)
+CLOSING = (END_LIST, END_OBJECT)
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def is_json_mime(mime):
+    return mime == 'application/json' or (mime.startswith('application/') and mime.endswith('+json'))
+
+
+def rejoin_bundle(bundle):
+    for mime, value in bundle.items():
+        if isinstance(value, list) and not is_json_mime(mime):
+            bundle[mime] = ''.join(value)
+    return bundle
+
+
+def rejoin_field(cell, key, value):
+    """Undo nbformat's split_lines on a decoded cell field"""
+    if key == 'source' and isinstance(value, list):
+        return ''.join(value)
+    if key == 'attachments' and isinstance(value, dict):
+        for attachment in value.values():
+            rejoin_bundle(attachment)
+    if key == 'outputs' and cell.get('cell_type') == 'code':
+        for output in value:
+            output_type = output.get('output_type', '')
+            if output_type in ('execute_result', 'display_data'):
+                rejoin_bundle(output.get('data', {}))
+            elif output_type and isinstance(output.get('text', ''), list):
+                output['text'] = ''.join(output['text'])
+    return value
+
+
+class LazyCell(Mapping):
+    """Read-only cell that decodes each field on first access"""
+
+    def __init__(self, raw, span, members):
+        self._raw = raw
+        self._span = span
+        self._members = members
+        self._values = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        start, end = self._members[key]
+        value = self._values[key] = rejoin_field(self, key, loads(self._raw[start:end]))
+        return value
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __reduce__(self):
+        # Pickle only the JSON of this cell, not the whole notebook
+        start, end = self._span
+        members = {key: (first - start, last - start) for key, (first, last) in self._members.items()}
+        return LazyCell, (self._raw[start:end], (0, end - start), members)
+
+    def __len__(self):
+        return len(self._members)
+
+    @property
+    def digest(self):
+        """Hash of the raw cell JSON, available without decoding the cell"""
+        start, end = self._span
+        return hashlib.sha1(self._raw[start:end]).hexdigest()
+
+    def __repr__(self):
+        return f'LazyCell({self._raw[self._span[0]:self._span[0] + 80]!r}...)'
+
+
+class LazyNotebook(Mapping):
+    """Read-only notebook with LazyCell cells"""
+
+    def __init__(self, raw, cells, members):
+        self._raw = raw
+        self._members = members
+        self._values = {'cells': cells}
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        start, end = self._members[key]
+        value = self._values[key] = loads(self._raw[start:end])
+        return value
+
+    def __iter__(self):
+        yield 'cells'
+        yield from self._members
+
+    def __len__(self):
+        return len(self._members) + 1
+
+    def __repr__(self):
+        return f'LazyNotebook(cells={len(self["cells"])})'
+
+
+def scan(raw):
+    """Yield (start, end, byte) for strings and structural characters
+
+    String contents are skipped with bytes.find, so large payloads such as
+    base64 images cost little more than a memchr.
+    """
+    search = STRUCTURE.search
+    find = raw.find
+    pos = 0
+    while True:
+        match = search(raw, pos)
+        if match is None:
+            return
+        start = match.start()
+        char = raw[start]
+        if char == QUOTE:
+            end = find(b'"', start + 1)
+            while end != -1:
+                escape = end - 1
+                while raw[escape] == BACKSLASH:
+                    escape -= 1
+                if (end - 1 - escape) % 2 == 0:
+                    break
+                end = find(b'"', end + 1)
+            if end == -1:
+                raise ValueError('Unterminated string in JSON document')
+            pos = end + 1
+        else:
+            pos = start + 1
+        yield start, pos, char
+
+
+def skip_value(raw, tokens):
+    """Consume tokens until the end of a value. Return (end, closing byte)"""
+    depth = 0
+    for start, _, char in tokens:
+        if char in OPENING:
+            depth += 1
+        elif char in CLOSING:
+            if depth == 0:
+                return start, char
+            depth -= 1
+        elif char == COMMA and depth == 0:
+            return start, char
+    raise ValueError('Unexpected end of JSON document')
+
+
+def read_members(raw, tokens, parse=None):
+    """Consume the members of an object after its '{'
+
+    Returns {key: (start, end)} with the raw span of each value. Values of
+    keys in parse are handled by parse[key](raw, tokens) instead and stored
+    as returned.
+    """
+    members = {}
+    for start, end, char in tokens:
+        if char in CLOSING:
+            return members, end
+        if char == COMMA:
+            continue
+        key = loads(raw[start:end])
+        _, value_start, _ = next(tokens)
+        if parse and key in parse:
+            members[key] = parse[key](raw, tokens)
+            continue
+        end, closing = skip_value(raw, tokens)
+        members[key] = (value_start, end)
+        if closing in CLOSING:
+            return members, end + 1
+    raise ValueError('Unexpected end of JSON document')
+
+
+def read_cells(raw, tokens):
+    if next(tokens)[2] != LIST:
+        raise ValueError('Expected a list of cells')
+    cells = []
+    for start, _, char in tokens:
+        if char == END_LIST:
+            return cells
+        if char == COMMA:
+            continue
+        if char != OBJECT:
+            raise ValueError('Expected a cell object')
+        members, end = read_members(raw, tokens)
+        cells.append(LazyCell(raw, (start, end), members))
+    raise ValueError('Unexpected end of JSON document')
+
+
+def index_notebook(raw):
+    """Return a LazyNotebook from the raw bytes of a v4 notebook"""
+    tokens = scan(raw)
+    first = next(tokens, None)
+    if first is None or first[2] != OBJECT:
+        raise ValueError('Notebook does not appear to be a JSON object')
+    members, _ = read_members(raw, tokens, parse={'cells': read_cells})
+    cells = members.pop('cells', [])
+    return LazyNotebook(raw, cells, members)
+
+
+def read_notebook(filename, validate=True):
+    """Read a notebook as nbformat v4
+
+    validate=False skips schema validation and decodes cells lazily.
+    """
+    import nbformat
+    if validate:
+        with open(filename, encoding='utf-8') as fil:
+            return nbformat.read(fil, as_version=4)
+    with open(filename, 'rb') as fil:
+        raw = fil.read()
+    nb = index_notebook(raw)
+    if nb.get('nbformat') != 4:
+        return nbformat.reads(raw.decode('utf-8'), as_version=4)
+    return nb
@@ -0,0 +1,114 @@
+"""Font metrics for measuring text widths
+
+Style uses ProportionMetrics by default, which estimates widths from the
+number of characters. FontMetrics loads TrueType faces once and measures
+text with per-glyph advance tables. Styles pick the metrics of each text
+by its font family, so monospace text can use its own face.
+"""
+import threading
+
+from functools import lru_cache
+
+
+@lru_cache(maxsize=256)
+def is_monospace(fontfamily):
+    """Check if a CSS font-family list falls back to the monospace generic family"""
+    return any(name.strip().lower() == 'monospace' for name in fontfamily.split(','))
+
+
+class ProportionMetrics:
+    """Estimate widths as len(text) * fontsize * proportion"""
+
+    def textwidth(self, text, fontsize, proportion, bold=False):
+        return len(text) * fontsize * proportion
+
+    def textwidths(self, texts, fontsize, proportion, bold=False):
+        return [len(text) * fontsize * proportion for text in texts]
+
+    def charwidth(self, fontsize, proportion, bold=False):
+        return fontsize * proportion
+
+    def __repr__(self):
+        return 'ProportionMetrics()'
+
+
+class AdvanceTable(dict):
+    """Maps characters to their advance width for a font face and size
+
+    Latin-1 glyphs are measured upfront, other glyphs on first use.
+    """
+
+    def __init__(self, font):
+        super().__init__()
+        self.font = font
+        self._lock = threading.Lock()
+        self._array = None
+        for code in range(256):
+            self[chr(code)] = font.getlength(chr(code))
+
+    def __missing__(self, char):
+        with self._lock:
+            advance = self.font.getlength(char)
+            self[char] = advance
+        return advance
+
+    def width(self, text):
+        return sum(map(self.__getitem__, text))
+
+    def widths(self, texts):
+        try:
+            import numpy as np
+        except ImportError:
+            return [self.width(text) for text in texts]
+        if self._array is None:
+            self._array = np.array([self[chr(code)] for code in range(256)])
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        codes = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32)
+        advances = self._array[np.minimum(codes, 255)]
+        wide = np.nonzero(codes > 255)[0]
+        if len(wide):
+            advances[wide] = [self[chr(code)] for code in codes[wide]]
+        cumulative = np.concatenate(([0.0], np.cumsum(advances)))
+        ends = np.cumsum(lengths)
+        return (cumulative[ends] - cumulative[ends - lengths]).tolist()
+
+
+@lru_cache(maxsize=None)
+def load_face(fonttype, fontsize):
+    from PIL import ImageFont
+    return ImageFont.truetype(fonttype, fontsize)
+
+
+@lru_cache(maxsize=None)
+def advance_table(fonttype, fontsize):
+    return AdvanceTable(load_face(fonttype, fontsize))
+
+
+class FontMetrics:
+    """Measure widths with the advance tables of TrueType fonts"""
+
+    sample = 'etaoinshrdlucmfwypvbgkqjxz ETAOINSHRDLU0123456789'
+
+    def __init__(self, fonttype, bold_fonttype=None):
+        self.fonttype = fonttype
+        self.bold_fonttype = bold_fonttype or fonttype
+
+    def table(self, fontsize, bold=False):
+        return advance_table(self.bold_fonttype if bold else self.fonttype, fontsize)
+
+    def textwidth(self, text, fontsize, proportion, bold=False):
+        return self.table(fontsize, bold).width(text)
+
+    def textwidths(self, texts, fontsize, proportion, bold=False):
+        return self.table(fontsize, bold).widths(texts)
+
+    def charwidth(self, fontsize, proportion, bold=False):
+        return self.table(fontsize, bold).width(self.sample) / len(self.sample)
+
+    def __repr__(self):
+        return f'FontMetrics({self.fonttype!r}, {self.bold_fonttype!r})'
+
+
+@lru_cache(maxsize=None)
+def font_metrics(fonttype, bold_fonttype=None):
+    return FontMetrics(fonttype, bold_fonttype)
@@ -0,0 +1,216 @@
+"""Post-build size optimizations for SVG trees
+
+Optimizer rewrites built elements in place:
+
+- pure translate groups are folded into the positions of their children
+  and unwrapped when nothing else is left on them;
+- coordinates are rounded to a fixed number of decimals;
+- presentation attributes (fonts, fills, ...) are replaced by generated
+  classes, declared once in a <style> element.
+
+Embedded documents (nested <svg>, <defs>, <style>, ...) are left untouched.
+"""
+import re
+
+from lxml import etree
+
+PRESENTATION = frozenset((
+    'font-family', 'font-size', 'font-weight', 'font-style', 'fill',
+    'text-anchor', 'text-decoration',
+))
+COORDINATES = frozenset(('x', 'y', 'width', 'height', 'x1', 'y1', 'x2', 'y2', 'cx', 'cy', 'r', 'rx', 'ry'))
+POSITIONED = ('text', 'rect', 'image', 'use')
+OPAQUE = ('svg', 'defs', 'style', 'symbol', 'script', 'foreignObject')
+TRANSLATE = re.compile(r'^\s*translate\(\s*([-+\d.eE]+)(?:\s*,?\s*([-+\d.eE]+))?\s*\)\s*$')
+NUMBER = re.compile(r'-?\d*\.\d+(?:[eE][-+]?\d+)?|-?\d+(?:[eE][-+]?\d+)?')
+
+
+def local_name(element):
+    tag = element.tag
+    if not isinstance(tag, str):
+        return None
+    return tag.rpartition('}')[2]
+
+
+def parse_translate(transform):
+    match = TRANSLATE.match(transform or '')
+    if match is None:
+        return None
+    return float(match.group(1)), float(match.group(2) or 0)
+
+
+def parse_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def format_number(value, precision):
+    text = f'{round(value, precision):.{precision}f}'
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+
+class Optimizer:
+    """Shrink SVG trees, keeping track of the bytes saved
+
+    Elements can be processed one subtree at a time, which lets streaming
+    writers optimize each cell as it is built and emit style_element() at
+    the end.
+    """
+
+    def __init__(self, precision=2, hoist=True, flatten=True, prefix='n'):
+        self.precision = precision
+        self.hoist = hoist
+        self.flatten = flatten
+        self.prefix = prefix
+        self.classes = {}
+        self.rules = {}
+        self.before = 0
+        self.after = 0
+
+    def process(self, element):
+        """Optimize an element and its descendants in place"""
+        self.before += len(etree.tostring(element))
+        if self.flatten:
+            self.fold(element, unwrap=False)
+        self.rewrite(element)
+        self.after += len(etree.tostring(element))
+        return element
+
+    def optimize(self, root):
+        """Optimize the children of a root element and add the <style>"""
+        self.round(root)
+        for child in list(root):
+            self.process(child)
+        style = self.style_element()
+        if style is not None:
+            root.insert(0, style)
+            self.after += len(etree.tostring(style))
+        return self.report()
+
+    def fold(self, element, unwrap=True):
+        name = local_name(element)
+        if name is None or name in OPAQUE:
+            return
+        if name == 'g':
+            offset = parse_translate(element.get('transform'))
+            if offset is not None and all(self.can_move(child) for child in element):
+                del element.attrib['transform']
+                for child in element:
+                    self.move(child, *offset)
+        for child in list(element):
+            self.fold(child)
+        if unwrap and name == 'g' and not element.attrib:
+            self.unwrap(element)
+
+    def can_move(self, element):
+        name = local_name(element)
+        if name is None:
+            return True
+        if name == 'g':
+            return 'transform' not in element.attrib or parse_translate(element.get('transform')) is not None
+        if name not in POSITIONED or 'transform' in element.attrib:
+            return False
+        if parse_number(element.get('x', '0')) is None or parse_number(element.get('y', '0')) is None:
+            return False
+        if name == 'text':
+            return not any(
+                'x' in child.attrib or 'y' in child.attrib
+                for child in element.iterdescendants()
+                if isinstance(child.tag, str)
+            )
+        return True
+
+    def move(self, element, dx, dy):
+        name = local_name(element)
+        if name is None or (dx == 0 and dy == 0):
+            return
+        if name == 'g':
+            x, y = parse_translate(element.get('transform')) or (0, 0)
+            element.set('transform', f'translate({x + dx}, {y + dy})')
+            return
+        for attribute, delta in (('x', dx), ('y', dy)):
+            if delta:
+                element.set(attribute, repr(parse_number(element.get(attribute, '0')) + delta))
+
+    def unwrap(self, element):
+        parent = element.getparent()
+        index = parent.index(element)
+        tail = element.tail
+        children = list(element)
+        for offset, child in enumerate(children):
+            parent.insert(index + offset, child)
+        if tail:
+            if children:
+                children[-1].tail = (children[-1].tail or '') + tail
+            elif index > 0:
+                parent[index - 1].tail = (parent[index - 1].tail or '') + tail
+            else:
+                parent.text = (parent.text or '') + tail
+        parent.remove(element)
+
+    def rewrite(self, element):
+        name = local_name(element)
+        if name is None or name in OPAQUE:
+            return
+        self.rewrite_attributes(element, self.hoist)
+        for child in element:
+            self.rewrite(child)
+
+    def round(self, element):
+        self.rewrite_attributes(element, hoist=False)
+
+    def rewrite_attributes(self, element, hoist):
+        """Round coordinates and replace presentation attributes by a class"""
+        precision = self.precision
+        attrib = element.attrib
+        declarations = []
+        for attribute, value in attrib.items():
+            if attribute in PRESENTATION:
+                declarations.append((attribute, value))
+            elif precision is None:
+                continue
+            elif attribute in COORDINATES:
+                number = parse_number(value)
+                if number is not None:
+                    attrib[attribute] = format_number(number, precision)
+            elif attribute == 'transform':
+                attrib[attribute] = NUMBER.sub(
+                    lambda match: format_number(float(match.group()), precision), value
+                )
+        if not hoist or not declarations or 'class' in attrib:
+            return
+        declarations = tuple(declarations)
+        name = self.classes.get(declarations)
+        if name is None:
+            body = ';'.join(
+                f'{attribute}:{self.css_value(attribute, value)}' for attribute, value in declarations
+            )
+            name = self.rules.get(body)
+            if name is None:
+                name = self.rules[body] = f'{self.prefix}{len(self.rules):x}'
+            self.classes[declarations] = name
+        for attribute, _ in declarations:
+            del attrib[attribute]
+        attrib['class'] = name
+
+    def css(self):
+        return ''.join(f'.{name}{{{body}}}' for body, name in self.rules.items())
+
+    def css_value(self, attribute, value):
+        if attribute == 'font-size' and parse_number(value) is not None:
+            return f'{value}px'
+        return value
+
+    def style_element(self):
+        if not self.rules:
+            return None
+        style = etree.Element('style')
+        style.text = self.css()
+        return style
+
+    def report(self):
+        return {'before': self.before, 'after': self.after, 'saved': self.before - self.after}
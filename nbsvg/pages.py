@@ -0,0 +1,36 @@
+"""Render notebooks as standalone SVG pages"""
+import os
+
+from multiprocessing import Pool
+
+
+def page_path(output, number):
+    """Return the path of a page: notebook.svg -> notebook-001.svg"""
+    base, ext = os.path.splitext(output)
+    return f'{base}-{number:03d}{ext or ".svg"}'
+
+
+def write_page(task):
+    page, output, precision, style = task
+    from .components import SVGElement
+    from .optimize import Optimizer
+    optimizer = Optimizer(precision=precision) if precision is not None else None
+    return output, SVGElement().add(page).write(output, style=style, optimize=optimizer)
+
+
+def render_pages(notebook, page_height, output, processes=None, precision=None, style=None):
+    """Paginate a Notebook and write one SVG per page
+
+    Pages are written by a pool of processes unless processes is 1, so
+    each worker only holds the page it is rendering.
+    Return a list of (path, optimization report) pairs in page order.
+    """
+    tasks = [
+        (page, page_path(output, page.number), precision, style)
+        for page in notebook.paginate(page_height, style=style)
+    ]
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    if processes == 1 or len(tasks) < 2:
+        return [write_page(task) for task in tasks]
+    with Pool(processes=min(processes or os.cpu_count() or 1, len(tasks))) as pool:
+        return list(pool.imap(write_page, tasks))
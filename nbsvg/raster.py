@@ -0,0 +1,178 @@
+"""Rasterization of HTML snippets through wkhtmltoimage
+
+A Rasterizer runs at most `workers` renderer processes at a time and keeps
+a content-addressed disk cache keyed by the HTML and the render options,
+so the same snippet is only rendered once across runs.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+def imgkit_backend(html, options):
+    import imgkit
+    return imgkit.from_string(html, False, options=options or None)
+
+
+def default_cache_dir():
+    return os.environ.get('NBSVG_CACHE_DIR') or os.path.join(
+        os.path.expanduser('~'), '.cache', 'nbsvg', 'html'
+    )
+
+
+class Rasterizer:
+    """Render HTML to PNG bytes on a bounded pool with a disk cache
+
+    backend is a callable (html, options) -> bytes. Each call of the default
+    backend spawns one wkhtmltoimage process. Set cache_dir to False to
+    disable the disk cache.
+    """
+
+    max_pending = 256
+
+    def __init__(self, backend=imgkit_backend, workers=4, cache_dir=None):
+        self.backend = backend
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def key(self, html, options=None):
+        data = json.dumps([html, options or {}], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def cache_path(self, key):
+        if self.cache_dir is False:
+            return None
+        return os.path.join(self.cache_dir or default_cache_dir(), key[:2], f'{key}.png')
+
+    def read_cache(self, key):
+        path = self.cache_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as fil:
+                return fil.read()
+        except OSError:
+            return None
+
+    def write_cache(self, key, data):
+        path = self.cache_path(key)
+        if path is None:
+            return False
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as fil:
+                fil.write(data)
+            os.replace(temp, path)
+        except OSError:
+            return False
+        return True
+
+    def executor(self):
+        # Pools do not survive fork, so each process creates its own
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix='nbsvg-raster'
+            )
+            self._pid = os.getpid()
+            self._pending = {}
+        return self._executor
+
+    def submit(self, html, options=None):
+        """Return a future with the PNG bytes of html"""
+        return self._submit(self.key(html, options), html, options)
+
+    def _submit(self, key, html, options):
+        with self._lock:
+            executor = self.executor()
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            data = self.read_cache(key)
+            if data is not None:
+                self.hits += 1
+                future = Future()
+                future.set_result(data)
+                return future
+            self.misses += 1
+            if len(self._pending) >= self.max_pending:
+                # Drop finished results that were prefetched but never used
+                for done in [k for k, f in self._pending.items() if f.done()]:
+                    del self._pending[done]
+            future = self._pending[key] = executor.submit(self._render, key, html, options)
+        return future
+
+    def _render(self, key, html, options):
+        try:
+            data = self.backend(html, options)
+        except BaseException:
+            with self._lock:
+                self._pending.pop(key, None)
+            raise
+        if self.write_cache(key, data):
+            with self._lock:
+                self._pending.pop(key, None)
+        return data
+
+    def render(self, html, options=None):
+        key = self.key(html, options)
+        future = self._submit(key, html, options)
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                if self._pending.get(key) is future:
+                    del self._pending[key]
+
+    def seed(self, html, data, options=None):
+        """Provide the PNG bytes of html rendered elsewhere, e.g. by nbsvg.aio"""
+        key = self.key(html, options)
+        with self._lock:
+            # executor() resets the pending futures of a new process first
+            self.executor()
+            if key not in self._pending:
+                future = self._pending[key] = Future()
+                future.set_result(data)
+
+    def forget(self, htmls, options=None):
+        """Drop the finished results of htmls that were seeded or prefetched but not used"""
+        with self._lock:
+            for html in htmls:
+                key = self.key(html, options)
+                future = self._pending.get(key)
+                if future is not None and future.done():
+                    del self._pending[key]
+
+    def prefetch(self, htmls, options=None):
+        """Start rendering all htmls concurrently without waiting for them"""
+        return [self.submit(html, options) for html in htmls]
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'pending': len(self._pending),
+            'workers': self.workers,
+        }
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def __repr__(self):
+        return f'Rasterizer(workers={self.workers!r}, cache_dir={self.cache_dir!r})'
+
+
+RASTERIZER = Rasterizer()
@@ -0,0 +1,380 @@
+"""Long-lived HTTP server that renders notebooks with warm caches
+
+POST /render takes a JSON object:
+
+    {"path": "analysis.ipynb", "indexes": [0, 3], "tags": ["figure"],
+     "operations": [{"index": 3, "operation": "remove_input"}],
+     "validate": false, "optimize": 2}
+
+"notebook" may replace "path" with the notebook JSON itself. Paths are
+relative to the root directory of the server and cannot leave it. GET
+/render accepts the same fields, except operations, as query parameters
+(lists are comma separated). GET /stats returns request latencies and the hit
+rates of the notebook, build and rasterizer caches.
+"""
+import hashlib
+import json
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+import traceback
+
+from collections import OrderedDict, deque
+from contextlib import suppress
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+from .loader import read_notebook
+
+OPERATIONS = frozenset((
+    'remove_input', 'remove_outputs', 'replace_execution_count', 'result_kwargs',
+    'display_kwargs', 'output_lines', 'select_blocks',
+))
+SELECTORS = {
+    'index': 'index_operation',
+    'count': 'count_operation',
+    'id': 'id_operation',
+    'tag': 'tag_operation',
+}
+INTEGER_LISTS = ('indexes', 'counts', 'order')
+STRING_LISTS = ('ids', 'tags')
+
+
+class NotebookStore:
+    """Parsed notebooks shared by requests and reloaded when their file changes
+
+    Notebooks posted as JSON are saved under a content-addressed name, so
+    repeated bodies reuse the same parsed notebook. save() pins the file
+    until release(); unpinned files are removed once their entries are
+    evicted.
+    """
+
+    def __init__(self, maxsize=32, directory=None):
+        self.maxsize = maxsize
+        self.owned = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix='nbsvg-')
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._posted = {}
+        self._lock = threading.Lock()
+
+    def read(self, filename, validate=True):
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), validate)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+        # Concurrent requests for the same notebook wait for a single parse
+        with loading:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == stamp:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self.misses += 1
+            nb = read_notebook(filename, validate)
+            with self._lock:
+                self._entries[key] = (stamp, nb)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._loading.pop(evicted, None)
+                    self.discard(evicted[0])
+        return nb
+
+    def discard(self, path):
+        # Called with the lock held
+        if self._posted.get(path, 1) or any(key[0] == path for key in self._entries):
+            return
+        del self._posted[path]
+        with suppress(OSError):
+            os.unlink(path)
+
+    def save(self, notebook):
+        """Return the pinned path of a notebook given as JSON text or object"""
+        if not isinstance(notebook, str):
+            notebook = json.dumps(notebook, ensure_ascii=False)
+        data = notebook.encode('utf-8')
+        path = os.path.join(self.directory, hashlib.sha1(data).hexdigest() + '.ipynb')
+        with self._lock:
+            if not os.path.exists(path):
+                fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as fil:
+                    fil.write(data)
+                os.replace(temp, path)
+            self._posted[path] = self._posted.get(path, 0) + 1
+        return path
+
+    def release(self, path):
+        """Unpin a path returned by save()"""
+        with self._lock:
+            self._posted[path] -= 1
+            self.discard(path)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'posted': len(self._posted),
+        }
+
+    def close(self):
+        if self.owned:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __repr__(self):
+        return f'NotebookStore(maxsize={self.maxsize!r})'
+
+
+class Metrics:
+    """Request counts and the latencies of the most recent renders"""
+
+    def __init__(self, window=1024):
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed, error=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += bool(error)
+            self.latencies.append(elapsed)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            result = {'requests': self.requests, 'errors': self.errors}
+        if latencies:
+            result['latency'] = {
+                'count': len(latencies),
+                'mean': sum(latencies) / len(latencies),
+                'p50': latencies[len(latencies) // 2],
+                'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                'max': latencies[-1],
+            }
+        return result
+
+
+def query_params(query):
+    """Convert GET query parameters to the fields of a JSON request"""
+    params = {}
+    for key, values in parse_qs(query).items():
+        value = values[-1]
+        if key in INTEGER_LISTS:
+            params[key] = [int(item) for item in value.split(',') if item]
+        elif key in STRING_LISTS:
+            params[key] = [item for item in value.split(',') if item]
+        elif key == 'validate':
+            params[key] = value.lower() not in ('0', 'false', 'no')
+        elif key == 'optimize':
+            params[key] = int(value)
+        else:
+            params[key] = value
+    return params
+
+
+def resolve_path(root, path):
+    """Return path relative to root, refusing paths outside of root"""
+    if not isinstance(path, str):
+        raise ValueError('path must be a string')
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise PermissionError(f'path outside of the served directory: {path}')
+    return resolved
+
+
+def create_notebook(params, store, root=None):
+    """Return the Notebook described by request parameters
+
+    With a root directory, paths are resolved against it and cannot leave it.
+    A posted notebook stays pinned in the store until
+    store.release(notebook.filename).
+    """
+    from .components import Notebook
+    if not isinstance(params, dict):
+        raise ValueError('expected a JSON object')
+    operations = []
+    for operation in params.get('operations', ()):
+        name = operation.get('operation')
+        if name not in OPERATIONS:
+            raise ValueError(f'unsupported operation: {name!r}')
+        selectors = [key for key in SELECTORS if key in operation]
+        if len(selectors) != 1:
+            raise ValueError('each operation needs exactly one of index, count, id or tag')
+        selector = selectors[0]
+        operations.append((SELECTORS[selector], operation[selector], name, operation.get('args', ())))
+    if 'notebook' in params:
+        path = store.save(params['notebook'])
+    elif 'path' in params:
+        path = params['path'] if root is None else resolve_path(root, params['path'])
+    else:
+        raise ValueError('missing path or notebook')
+    try:
+        notebook = Notebook(
+            path,
+            indexes=params.get('indexes'), counts=params.get('counts'), ids=params.get('ids'),
+            tags=params.get('tags'), order=params.get('order'),
+            validate=params.get('validate', True), loader=store.read,
+        )
+        for method, value, name, args in operations:
+            getattr(notebook, method)(value, name, *args)
+    except BaseException:
+        # Requests that fail here never reach the release of the handler
+        if 'notebook' in params:
+            store.release(path)
+        raise
+    return notebook
+
+
+def render_notebook(notebook, precision=None):
+    """Return the SVG bytes of a Notebook"""
+    from .components import SVGElement
+    from .optimize import Optimizer
+    output = BytesIO()
+    optimizer = Optimizer(precision=precision) if precision is not None else None
+    SVGElement().add(notebook).write(output, optimize=optimizer)
+    return output.getvalue()
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+
+    server_version = 'nbsvg'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/stats':
+            self.send_body(200, json.dumps(self.server.stats()).encode('utf-8'), 'application/json')
+        elif url.path == '/render':
+            try:
+                params = query_params(url.query)
+            except ValueError as error:
+                return self.send_body(400, f'{error}\n'.encode('utf-8'))
+            self.render(params)
+        else:
+            self.send_body(404, b'not found\n')
+
+    def do_POST(self):
+        if urlsplit(self.path).path != '/render':
+            return self.send_body(404, b'not found\n')
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            params = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as error:
+            return self.send_body(400, f'invalid JSON: {error}\n'.encode('utf-8'))
+        self.render(params)
+
+    def render(self, params):
+        start = time.perf_counter()
+        status, body, content_type = 200, None, 'image/svg+xml'
+        notebook = None
+        try:
+            precision = params.get('optimize') if isinstance(params, dict) else None
+            if precision is not None:
+                precision = int(precision)
+            notebook = create_notebook(params, self.server.store, self.server.root)
+        except PermissionError as error:
+            status, body = 403, f'{error}\n'.encode('utf-8')
+        except (ValueError, TypeError, AttributeError) as error:
+            status, body = 400, f'{error}\n'.encode('utf-8')
+        else:
+            try:
+                body = render_notebook(notebook, precision)
+            except FileNotFoundError as error:
+                status, body = 404, f'{error}\n'.encode('utf-8')
+            except Exception:
+                status, body = 500, traceback.format_exc().encode('utf-8')
+            finally:
+                if 'notebook' in params:
+                    self.server.store.release(notebook.filename)
+        if status != 200:
+            content_type = 'text/plain; charset=utf-8'
+        self.server.metrics.record(time.perf_counter() - start, error=status != 200)
+        self.send_body(status, body, content_type)
+
+    def send_body(self, status, body, content_type='text/plain; charset=utf-8'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class RenderServerMixin:
+    """State shared by the TCP and Unix socket servers"""
+
+    daemon_threads = True
+
+    def setup_render(self, store=None, quiet=False, root=None):
+        self.store = store or NotebookStore()
+        self.metrics = Metrics()
+        self.quiet = quiet
+        self.root = root
+        self.started = time.time()
+
+    def stats(self):
+        from .components.cache import BUILD_CACHE
+        from .raster import RASTERIZER
+        return {
+            'uptime': time.time() - self.started,
+            **self.metrics.stats(),
+            'notebooks': self.store.stats(),
+            'build_cache': BUILD_CACHE.stats(),
+            'rasterizer': RASTERIZER.stats(),
+        }
+
+
+class RenderServer(RenderServerMixin, ThreadingHTTPServer):
+
+    def __init__(self, address, store=None, quiet=False, root=None, handler=RenderHandler):
+        super().__init__(address, handler)
+        self.setup_render(store, quiet, root)
+
+
+class UnixRenderServer(RenderServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    def __init__(self, path, store=None, quiet=False, root=None, handler=RenderHandler):
+        super().__init__(path, handler)
+        self.setup_render(store, quiet, root)
+
+
+def serve(host='127.0.0.1', port=8000, socket_path=None, quiet=False, root='.'):
+    """Serve notebooks under root until interrupted"""
+    root = os.path.realpath(root)
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = UnixRenderServer(socket_path, quiet=quiet, root=root)
+        location = f'unix:{socket_path}'
+    else:
+        server = RenderServer((host, port), quiet=quiet, root=root)
+        location = f'http://{host}:{server.server_address[1]}'
+    print(f'nbsvg: serving {root} on {location}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.store.close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.unlink(socket_path)
+    return 0
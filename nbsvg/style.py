@@ -1,9 +1,17 @@
 """Define base style for components"""
-from copy import copy
+import hashlib
+
+from .metrics import ProportionMetrics, font_metrics, is_monospace
+
+
+def settings_hash(cls, values):
+    """Return a hash of a style class and its settings"""
+    data = repr((cls.__qualname__, sorted((key, repr(value)) for key, value in values.items())))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
 
 class Style:
     
-    old = []
     input_width = 35
     width = 700
     fontsize = 10
@@ -13,12 +21,23 @@ class Style:
     fontfamily = 'monospace'
     fontwidth_proportion = 0.6
     textanchor = 'start'
+    output_max_lines = None
+    output_head_lines = 20
+    output_tail_lines = 20
+    metrics = ProportionMetrics()
+    monospace_metrics = None
     
     table_bold_fontwidth_proportion = 0.67
     table_fontwidth_proportion = 0.6
     table_colpadding = 5
     table_fontsize = 8
     table_oversize_proportion = 1.3
+    table_max_rows = 60
+    table_head_rows = 5
+    table_tail_rows = 5
+    table_max_cols = 20
+    table_head_cols = 10
+    table_tail_cols = 10
     table_fontfamily = '-apple-system, BlinkMacSystemFont, "Segoe UI", Helvetica, Arial, sans-serif, "Apple Color Emoji", "Segoe UI Emoji", "Segoe UI Symbol"'
     
     markdown_fontfamily = '-apple-system, BlinkMacSystemFont, "Segoe UI", Helvetica, Arial, sans-serif, "Apple Color Emoji", "Segoe UI Emoji", "Segoe UI Symbol"'
@@ -52,43 +71,175 @@ class Style:
     
     
     
-    def apply(self, kwargs, this=True):
-        result = self if this else copy(self)
-        result.old.append({})  
-        for key, value in kwargs.items():
-            result.old[-1][key] = getattr(self, key, None)
-            setattr(result, key, value)
-        return result
-        
-    def undo(self):
-        old = self.old.pop()
-        for key, value in old.items():
-            setattr(self, key, value)
-            
+    def apply(self, kwargs):
+        """Return a StyleLayer that overrides kwargs on top of this style"""
+        if not kwargs:
+            return self
+        return StyleLayer(self, kwargs)
+
+    def values(self):
+        """Return all settings of the style"""
+        values = {}
+        for cls in reversed(type(self).__mro__):
+            values.update(vars(cls))
+        values.update(vars(self))
+        return {
+            key: value for key, value in values.items()
+            if not key.startswith('_') and not callable(value)
+        }
+
+    def fingerprint(self):
+        """Return a hash of the class and settings of the style"""
+        return settings_hash(type(self), self.values())
+
+    def family_metrics(self, fontfamily=None):
+        """Return the metrics of a font family (default: fontfamily)"""
+        if self.monospace_metrics is not None and is_monospace(fontfamily or self.fontfamily):
+            return self.monospace_metrics
+        return self.metrics
+
+    def textwidth(self, text, fontsize=None, proportion=None, bold=False):
+        return self.family_metrics().textwidth(
+            text, fontsize or self.fontsize, proportion or self.fontwidth_proportion, bold
+        )
+
+    def textwidths(self, texts, fontsize=None, proportion=None, bold=False):
+        return self.family_metrics().textwidths(
+            texts, fontsize or self.fontsize, proportion or self.fontwidth_proportion, bold
+        )
+
     def getsizeintable(self, text, bold):
         prop = self.table_fontwidth_proportion
         if bold:
             prop = self.table_bold_fontwidth_proportion
-        return len(text) * prop * self.table_fontsize + self.table_colpadding
+        metrics = self.family_metrics(self.table_fontfamily)
+        return metrics.textwidth(text, self.table_fontsize, prop, bold) + self.table_colpadding
+
+    def tablewidths(self, texts, bold):
+        prop = self.table_fontwidth_proportion
+        if bold:
+            prop = self.table_bold_fontwidth_proportion
+        return self.family_metrics(self.table_fontfamily).textwidths(texts, self.table_fontsize, prop, bold)
+
+    def name_metrics(self, name):
+        """Return the metrics of table or markdown (p, h1, ...) text"""
+        return self.family_metrics(getattr(self, f'{name}_fontfamily', None) or self.markdown_fontfamily)
 
     def fontlen(self, width, name):
-        return int(
-            width
-            // (getattr(self, f'{name}_fontsize') * getattr(self, f'{name}_fontwidth_proportion'))
-            * getattr(self, f'{name}_oversize_proportion')
+        charwidth = self.name_metrics(name).charwidth(
+            getattr(self, f'{name}_fontsize'), getattr(self, f'{name}_fontwidth_proportion')
         )
+        return int(width // charwidth * getattr(self, f'{name}_oversize_proportion'))
+
+    def linewidth(self, width, name):
+        """Width available for measured text in lines of fontlen characters"""
+        fontsize = getattr(self, f'{name}_fontsize')
+        return self.fontlen(width, name) * self.name_metrics(name).charwidth(
+            fontsize, getattr(self, f'{name}_fontwidth_proportion')
+        )
+
+class StyleLayer:
+    """Immutable frame of overrides on top of a Style
+
+    Attribute lookups walk the frames from the newest to the oldest and then
+    fall back to the base Style, so pushing a frame is O(1) and popping it is
+    just dropping the reference. Layers never change after creation, which
+    makes them safe to share between threads. Style methods are bound to the
+    layer, so they see the overridden values.
+    """
+
+    __slots__ = ('_base', '_parent', '_frame', '_fingerprint')
+
+    def __init__(self, parent, frame):
+        if isinstance(parent, StyleLayer):
+            base = parent._base
+        else:
+            base, parent = parent, None
+        object.__setattr__(self, '_base', base)
+        object.__setattr__(self, '_parent', parent)
+        object.__setattr__(self, '_frame', dict(frame))
+
+    def __getattr__(self, name):
+        layer = self
+        while layer is not None:
+            frame = layer._frame
+            if name in frame:
+                return frame[name]
+            layer = layer._parent
+        base = self._base
+        try:
+            return vars(base)[name]
+        except KeyError:
+            pass
+        value = getattr(type(base), name)
+        get = getattr(type(value), '__get__', None)
+        if get is not None:
+            return get(value, self, type(base))
+        return value
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"StyleLayer is immutable. Use apply({{'{name}': ...}}) instead")
+
+    def __delattr__(self, name):
+        raise AttributeError("StyleLayer is immutable")
+
+    def __reduce__(self):
+        return StyleLayer, (self._parent or self._base, self._frame)
+
+    def apply(self, kwargs):
+        if not kwargs:
+            return self
+        return StyleLayer(self, kwargs)
+
+    def pop(self):
+        """Return the style below this frame"""
+        return self._parent or self._base
+
+    def values(self):
+        frames = []
+        layer = self
+        while layer is not None:
+            frames.append(layer._frame)
+            layer = layer._parent
+        values = self._base.values()
+        for frame in reversed(frames):
+            values.update(frame)
+        return values
+
+    def fingerprint(self):
+        # Layers are immutable, so the hash is computed once per layer
+        try:
+            return self._fingerprint
+        except AttributeError:
+            pass
+        result = settings_hash(type(self._base), self.values())
+        object.__setattr__(self, '_fingerprint', result)
+        return result
+
+    def __repr__(self):
+        return f'StyleLayer({self.pop()!r}, {self._frame!r})'
+
 
 class PilStyle(Style):
     
     fonttype = "SEGOEUI.TTF"
     bold_fonttype = "SEGOEUIB.TTF"
-    
-    def getsizeintable(self, text, bold):
-        from PIL import ImageFont
-        cfont = ImageFont.truetype(self.fonttype, self.table_fontsize)
-        if bold:
-            cfont = ImageFont.truetype(self.bold_fonttype, self.table_fontsize)
-        return cfont.getsize(text)[0] + self.table_colpadding
+    monospace_fonttype = None
+    bold_monospace_fonttype = None
+
+    @property
+    def metrics(self):
+        return font_metrics(self.fonttype, self.bold_fonttype)
+
+    @property
+    def monospace_metrics(self):
+        if self.monospace_fonttype is None:
+            # Every monospace glyph advances fontsize * proportion
+            return MONOSPACE_METRICS
+        return font_metrics(self.monospace_fonttype, self.bold_monospace_fonttype)
+
+
+MONOSPACE_METRICS = ProportionMetrics()
 
 
-STYLE = Style()
+STYLE = Style()
\ No newline at end of file
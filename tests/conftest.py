@@ -0,0 +1,38 @@
+import nbformat
+import pytest
+
+from benchmarks import synthetic
+from nbsvg.components.cache import BUILD_CACHE
+
+SMALL = {
+    'code_cells': 3,
+    'code_lines': 8,
+    'dataframe_rows': 6,
+    'dataframe_cols': 3,
+    'figures': 2,
+    'figure_size': 100,
+    'svg_figures': 1,
+    'markdown_paragraphs': 3,
+    'traceback_lines': 6,
+    'stream_lines': 12,
+}
+
+
+@pytest.fixture(scope='session')
+def notebook_path(tmp_path_factory):
+    """Small synthetic notebook with code, markdown, a dataframe, figures and streams"""
+    nb = synthetic.generate(**SMALL)
+    # Repeat a figure so image deduplication has something to share
+    figure = nbformat.from_dict(nb.cells[-4])
+    figure.id = 'repeated-figure'
+    nb.cells.append(figure)
+    path = tmp_path_factory.mktemp('notebooks') / 'small.ipynb'
+    nbformat.write(nb, str(path))
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def empty_build_cache():
+    BUILD_CACHE.clear()
+    yield
+    BUILD_CACHE.clear()
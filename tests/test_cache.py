@@ -0,0 +1,104 @@
+import pytest
+
+from lxml.builder import E
+
+from nbsvg.components import Code, Error, Text
+from nbsvg.components.base import StylizedElement
+from nbsvg.components.cache import BuildCache, fingerprint
+from nbsvg.style import STYLE
+
+
+class Box(StylizedElement):
+
+    def __init__(self, key, size=10, **kwargs):
+        super().__init__(**kwargs)
+        self.key = key
+        self.size = size
+
+    def cache_key(self):
+        return self.key, self.size
+
+    def build(self, style):
+        self.element = E.g(E.text('x' * self.size))
+        self.width = self.height = self.size
+
+
+def built(key, size=10):
+    return Box(key, size).do_build()
+
+
+def test_fingerprint_rejects_objects_without_stable_repr():
+    assert fingerprint('a', 1, None, (True, 2.5)) == fingerprint('a', 1, None, [True, 2.5])
+    assert fingerprint(Text) == fingerprint(Text)
+    with pytest.raises(TypeError):
+        fingerprint(object())
+
+
+def test_unfingerprintable_inputs_disable_caching():
+    cache = BuildCache()
+    assert cache.key(Box('a'), STYLE) is not None
+    assert cache.key(Box(object()), STYLE) is None
+
+
+def test_hits_return_copies():
+    cache = BuildCache()
+    key = cache.key(Box('a'), STYLE)
+    cache.put(key, built('a'))
+    first, width, height = cache.get(key)
+    first.set('transform', 'translate(1, 1)')
+    second, _, _ = cache.get(key)
+    assert second.get('transform') is None
+    assert (width, height) == (10, 10)
+
+
+def test_size_counts_hits_and_misses():
+    cache = BuildCache()
+    key = cache.key(Box('a'), STYLE)
+    assert cache.size(key) is None
+    cache.put(key, built('a'))
+    assert cache.size(key) == (10, 10)
+    cache.get(key, record=False)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_measure_and_emit_count_one_lookup(monkeypatch):
+    cache = BuildCache()
+    monkeypatch.setattr('nbsvg.components.base.BUILD_CACHE', cache)
+    Code('hello').do_measure().do_emit()
+    Code('hello').do_measure().do_emit()
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_text_lines_are_not_cached(monkeypatch):
+    cache = BuildCache()
+    monkeypatch.setattr('nbsvg.components.base.BUILD_CACHE', cache)
+    Error({'traceback': ['first', 'second']}).do_build()
+    Text('hello').do_build()
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_layer_fingerprint_tracks_settings():
+    layer = STYLE.apply({'fontsize': 12})
+    assert layer.fingerprint() is layer.fingerprint()
+    assert layer.fingerprint() == STYLE.apply({'fontsize': 12}).fingerprint()
+    assert layer.fingerprint() != STYLE.apply({'fontsize': 13}).fingerprint()
+    assert layer.apply({'fontsize': 10}).fingerprint() == STYLE.fingerprint()
+
+
+def test_cache_is_bounded_by_bytes():
+    cache = BuildCache(maxbytes=4000)
+    for i in range(20):
+        cache.put(f'key{i}', built(i, size=200))
+    assert 0 < cache.nbytes <= 4000
+    assert len(cache) < 20
+    assert cache.get('key19') is not None
+    assert cache.get('key0') is None
+
+
+def test_large_elements_are_not_cached():
+    cache = BuildCache(maxbytes=4000)
+    cache.put('small', built('small', size=100))
+    cache.put('large', built('large', size=2000))
+    assert cache.get('large') is None
+    assert cache.get('small') is not None
@@ -0,0 +1,20 @@
+import base64
+
+from io import BytesIO
+
+from benchmarks import synthetic
+from nbsvg.components import Image
+
+B64 = synthetic.png_base64(40, 20, 0)
+PNG = base64.b64decode(B64)
+
+
+def test_image_sources_give_the_same_element(tmp_path):
+    path = tmp_path / 'image.png'
+    path.write_bytes(PNG)
+    expected = Image(f'data:image/png;base64,{B64}').xml
+    assert b'width="40" height="20.0"' in expected
+    assert Image(PNG).xml == expected
+    assert Image(str(path)).xml == expected
+    assert Image(path).xml == expected
+    assert Image(BytesIO(PNG)).xml == expected
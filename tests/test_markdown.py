@@ -0,0 +1,18 @@
+from pygments.lexers import HtmlLexer, PythonLexer
+from pygments.lexers.rust import RustLexer
+
+from nbsvg.components import Markdown
+from nbsvg.components.markdown import LEXER_MAP, get_lexer
+
+
+def test_get_lexer_resolves_names():
+    assert get_lexer('python') is PythonLexer
+    assert get_lexer('unknown') is HtmlLexer
+    assert get_lexer(None) is HtmlLexer
+
+
+def test_get_lexer_accepts_classes(monkeypatch):
+    monkeypatch.setitem(LEXER_MAP, 'rust', RustLexer)
+    assert get_lexer('rust') is RustLexer
+    markdown = Markdown('```rust\nfn main() {}\n```').do_build()
+    assert markdown.element.find('.//text') is not None
@@ -0,0 +1,100 @@
+import base64
+import os
+import stat
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+import nbformat
+import pytest
+
+from benchmarks import synthetic
+from nbsvg import raster
+from nbsvg.components import Notebook, SVGElement
+
+PNG = base64.b64decode(synthetic.png_base64(40, 20, 0))
+
+
+@pytest.fixture
+def html_notebook_path(tmp_path, monkeypatch):
+    """Notebook of HTML display_data cells, rasterized by a stub wkhtmltoimage"""
+    pytest.importorskip('imgkit')
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    command = bin_dir / 'wkhtmltoimage'
+    command.write_text(f'#!{sys.executable}\nimport sys\nsys.stdout.buffer.write({PNG!r})\n')
+    command.chmod(command.stat().st_mode | stat.S_IEXEC)
+    # Worker processes inherit the environment, not monkeypatched objects
+    monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+    monkeypatch.setenv('NBSVG_CACHE_DIR', str(tmp_path / 'cache'))
+    nb = nbformat.v4.new_notebook()
+    for i in range(4):
+        output = nbformat.v4.new_output('display_data', {'text/html': f'<b>{i}</b>'})
+        nb.cells.append(nbformat.v4.new_code_cell('h', execution_count=i, outputs=[output]))
+    path = tmp_path / 'html.ipynb'
+    nbformat.write(nb, str(path))
+    return str(path)
+
+
+def fresh_build(path, **kwargs):
+    return SVGElement().add(Notebook(path, **kwargs)).xml
+
+
+def test_rebuild_matches_fresh_build(notebook_path):
+    expected = fresh_build(notebook_path)
+    notebook = Notebook(notebook_path)
+    first = SVGElement().add(notebook)
+    assert first.xml == expected
+    assert SVGElement().add(notebook).xml == expected
+    # Reusing the layout must not take elements away from the first tree
+    assert first.xml == expected
+
+
+def test_rebuild_after_in_place_passes(notebook_path):
+    expected = fresh_build(notebook_path)
+    assert expected.count(b'<symbol') == 2
+    notebook = Notebook(notebook_path)
+    SVGElement().add(notebook).optimize()
+    assert SVGElement().add(notebook).xml == expected
+    assert SVGElement().add(notebook).xml == expected
+
+
+def test_image_dedup_leaves_component_trees_alone(notebook_path):
+    notebook = Notebook(notebook_path)
+    svg = SVGElement().add(notebook)
+    assert svg.xml.count(b'<use') == 3
+    assert len(notebook.element.findall('.//image')) == 3
+    assert notebook.element.find('.//use') is None
+    # The root holds the component tree itself, not a copy of it
+    assert svg.element[0] is notebook.element
+    assert svg.xml.count(b'<use') == 3
+    svg.optimize()
+    assert svg.xml.count(b'<symbol') == 2
+
+
+def test_parallel_builds_match_serial_build(notebook_path):
+    expected = fresh_build(notebook_path)
+    assert fresh_build(notebook_path, jobs=2) == expected
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert fresh_build(notebook_path, executor=executor) == expected
+    notebook = Notebook(notebook_path, jobs=2)
+    SVGElement().add(notebook).xml
+    assert SVGElement().add(notebook).xml == expected
+
+
+def test_process_pools_do_not_prefetch_html(notebook_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(raster.RASTERIZER, 'prefetch', calls.append)
+    fresh_build(notebook_path, jobs=2)
+    assert calls == []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        fresh_build(notebook_path, executor=executor)
+    assert len(calls) == 1
+    Notebook(notebook_path, jobs=2).do_measure()
+    assert len(calls) == 2
+
+
+def test_worker_processes_rasterize_html(html_notebook_path):
+    expected = fresh_build(html_notebook_path)
+    assert expected.count(b'<use') == 4
+    assert fresh_build(html_notebook_path, jobs=2) == expected
@@ -0,0 +1,117 @@
+import os
+import stat
+import sys
+import threading
+
+import pytest
+
+from nbsvg.raster import Rasterizer
+
+PNG = b'\x89PNG\r\n\x1a\nstub'
+
+STUB_COMMAND = f'''#!{sys.executable}
+import sys
+html = sys.stdin.buffer.read()
+sys.stdout.buffer.write({PNG!r} + html)
+'''
+
+
+class StubBackend:
+    """Renders html to PNG + html, optionally waiting for release"""
+
+    def __init__(self, blocked=False):
+        self.calls = []
+        self.release = threading.Event()
+        if not blocked:
+            self.release.set()
+
+    def __call__(self, html, options):
+        self.calls.append(html)
+        self.release.wait(5)
+        if html == 'fail':
+            raise OSError('render failed')
+        return PNG + html.encode('utf-8')
+
+
+@pytest.fixture
+def backend():
+    return StubBackend()
+
+
+def test_render(backend, tmp_path):
+    rasterizer = Rasterizer(backend, cache_dir=str(tmp_path))
+    assert rasterizer.render('<b>a</b>') == PNG + b'<b>a</b>'
+    assert backend.calls == ['<b>a</b>']
+    assert rasterizer.stats()['pending'] == 0
+
+
+def test_pending_futures_are_shared(tmp_path):
+    backend = StubBackend(blocked=True)
+    rasterizer = Rasterizer(backend, cache_dir=str(tmp_path))
+    first = rasterizer.submit('a')
+    second = rasterizer.submit('a')
+    other = rasterizer.submit('a', {'width': 100})
+    assert first is second
+    assert other is not first
+    backend.release.set()
+    assert first.result(5) == second.result(5) == PNG + b'a'
+    other.result(5)
+    assert sorted(backend.calls) == ['a', 'a']
+    assert (rasterizer.hits, rasterizer.misses) == (0, 2)
+    rasterizer.shutdown()
+
+
+def test_disk_cache_is_shared_across_rasterizers(backend, tmp_path):
+    Rasterizer(backend, cache_dir=str(tmp_path)).render('a')
+    rasterizer = Rasterizer(backend, cache_dir=str(tmp_path))
+    assert rasterizer.render('a') == PNG + b'a'
+    assert backend.calls == ['a']
+    assert (rasterizer.hits, rasterizer.misses) == (1, 0)
+
+
+def test_disabled_disk_cache(backend, tmp_path):
+    Rasterizer(backend, cache_dir=False).render('a')
+    Rasterizer(backend, cache_dir=False).render('a')
+    assert backend.calls == ['a', 'a']
+
+
+def test_prefetch_renders_each_snippet_once(tmp_path):
+    backend = StubBackend(blocked=True)
+    rasterizer = Rasterizer(backend, workers=2, cache_dir=str(tmp_path))
+    futures = rasterizer.prefetch(['a', 'b', 'a'])
+    assert futures[0] is futures[2]
+    backend.release.set()
+    assert rasterizer.render('b') == PNG + b'b'
+    assert rasterizer.render('a') == PNG + b'a'
+    assert sorted(backend.calls) == ['a', 'b']
+    assert rasterizer.stats()['pending'] == 0
+
+
+def test_failures_are_retried(backend, tmp_path):
+    rasterizer = Rasterizer(backend, cache_dir=str(tmp_path))
+    with pytest.raises(OSError):
+        rasterizer.render('fail')
+    with pytest.raises(OSError):
+        rasterizer.render('fail')
+    assert backend.calls == ['fail', 'fail']
+    assert os.listdir(tmp_path) == []
+
+
+def test_seeded_results_are_used(backend, tmp_path):
+    rasterizer = Rasterizer(backend, cache_dir=str(tmp_path))
+    rasterizer.seed('a', b'seeded')
+    assert rasterizer.render('a') == b'seeded'
+    assert backend.calls == []
+
+
+def test_default_backend_runs_wkhtmltoimage(tmp_path, monkeypatch):
+    pytest.importorskip('imgkit')
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    command = bin_dir / 'wkhtmltoimage'
+    command.write_text(STUB_COMMAND)
+    command.chmod(command.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+    rasterizer = Rasterizer(cache_dir=str(tmp_path / 'cache'))
+    assert rasterizer.render('<b>a</b>').startswith(PNG)
+    assert Rasterizer(cache_dir=str(tmp_path / 'cache')).render('<b>a</b>').startswith(PNG)
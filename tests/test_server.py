@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import threading
+import urllib.error
+import urllib.request
+
+import nbformat
+import pytest
+
+from nbsvg.server import NotebookStore, RenderServer, resolve_path
+
+
+@pytest.fixture
+def server(tmp_path, notebook_path):
+    root = tmp_path / 'root'
+    root.mkdir()
+    shutil.copy(notebook_path, root / 'small.ipynb')
+    server = RenderServer(('127.0.0.1', 0), store=NotebookStore(maxsize=2), quiet=True, root=str(root))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.store.close()
+
+
+def post(server, params):
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{server.server_address[1]}/render', data=json.dumps(params).encode('utf-8')
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+
+
+def test_resolve_path(tmp_path):
+    root = str(tmp_path)
+    assert resolve_path(root, 'a/b.ipynb') == os.path.join(os.path.realpath(root), 'a', 'b.ipynb')
+    with pytest.raises(PermissionError):
+        resolve_path(root, '../b.ipynb')
+    with pytest.raises(PermissionError):
+        resolve_path(root, '/etc/passwd')
+
+
+def test_render_path_under_root(server):
+    status, body = post(server, {'path': 'small.ipynb', 'indexes': [0, 1]})
+    assert status == 200
+    assert body.startswith(b'<!DOCTYPE svg')
+
+
+def test_paths_outside_root_are_forbidden(server, notebook_path):
+    assert post(server, {'path': notebook_path})[0] == 403
+    assert post(server, {'path': '../../small.ipynb'})[0] == 403
+    assert post(server, {'path': 'missing.ipynb'})[0] == 404
+
+
+def test_posted_notebooks_are_removed_on_eviction(server):
+    for i in range(5):
+        nb = nbformat.v4.new_notebook(cells=[nbformat.v4.new_markdown_cell(f'# Notebook {i}')])
+        assert post(server, {'notebook': nb})[0] == 200
+    assert len(os.listdir(server.store.directory)) == 2
+    assert server.store.stats()['posted'] == 2
+
+
+def test_invalid_posted_notebook(server):
+    status, _ = post(server, {'notebook': '{"cells": 1}'})
+    assert status == 500
+    assert server.store.stats()['posted'] == 0
+    assert os.listdir(server.store.directory) == []
+
+
+def test_rejected_posted_notebooks_are_released(server):
+    nb = nbformat.v4.new_notebook(cells=[nbformat.v4.new_markdown_cell('# Notebook')])
+    operation = {'operation': 'remove_input', 'index': 0, 'args': 5}
+    assert post(server, {'notebook': nb, 'operations': [operation]})[0] == 400
+    assert server.store.stats()['posted'] == 0
+    assert post(server, {'notebook': nb, 'indexes': 5})[0] == 400
+    assert server.store.stats()['posted'] == 0
+    assert os.listdir(server.store.directory) == []
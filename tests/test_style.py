@@ -0,0 +1,61 @@
+from nbsvg.components import Markdown, Text, WrapTable
+from nbsvg.metrics import ProportionMetrics, is_monospace
+from nbsvg.style import PilStyle, Style
+
+
+class FixedMetrics(ProportionMetrics):
+    """Every glyph is advance pixels wide, whatever the font size"""
+
+    def __init__(self, advance):
+        self.advance = advance
+
+    def textwidth(self, text, fontsize, proportion, bold=False):
+        return len(text) * self.advance
+
+    def textwidths(self, texts, fontsize, proportion, bold=False):
+        return [len(text) * self.advance for text in texts]
+
+    def charwidth(self, fontsize, proportion, bold=False):
+        return self.advance
+
+    def __repr__(self):
+        return f'FixedMetrics({self.advance!r})'
+
+
+class TwoFaceStyle(Style):
+    metrics = FixedMetrics(7)
+    monospace_metrics = FixedMetrics(5)
+
+
+def test_is_monospace():
+    assert is_monospace('monospace')
+    assert is_monospace('SFMono-Regular, Menlo, Consolas, monospace')
+    assert not is_monospace('-apple-system, "Segoe UI", Helvetica, sans-serif')
+
+
+def test_monospace_text_uses_monospace_metrics():
+    style = TwoFaceStyle()
+    assert Text('abcd').do_build(style).width == 20
+    assert Text('abcd', fontfamily='Helvetica').do_build(style).width == 28
+
+
+def test_proportional_text_uses_proportional_metrics():
+    style = TwoFaceStyle()
+    assert style.family_metrics(style.markdown_fontfamily).advance == 7
+    row = [{'value': 'abcd', 'bold': False, 'lines': ['abcd']}]
+    narrow = TwoFaceStyle().apply({'metrics': FixedMetrics(5)})
+    width = WrapTable([row, row], [0]).do_build(style).width
+    assert width - WrapTable([row, row], [0]).do_build(narrow).width == 8
+    # Paragraphs wrap with the advance of the markdown font
+    words = ' '.join(['word'] * 200)
+
+    def lines(style):
+        return len(Markdown(words).do_build(style).element.findall('.//text'))
+
+    assert lines(style) == lines(style.apply({'monospace_metrics': FixedMetrics(7)}))
+
+
+def test_pil_style_measures_monospace_without_loading_faces():
+    # The proportional face (SEGOEUI.TTF) is not needed for monospace text
+    style = PilStyle()
+    assert Text('abc').do_build(style).width == 3 * style.fontsize * style.fontwidth_proportion
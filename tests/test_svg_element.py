@@ -0,0 +1,47 @@
+import os
+import stat
+
+import pytest
+
+from nbsvg.components import SVGElement, Text
+from nbsvg.components.base import StylizedElement
+
+
+class Broken(StylizedElement):
+
+    def build(self, style):
+        raise ValueError('broken')
+
+
+def test_write_path(tmp_path):
+    output = tmp_path / 'out.svg'
+    SVGElement().add(Text('hello')).write(output)
+    assert output.read_bytes().startswith(b'<!DOCTYPE svg')
+    assert b'hello' in output.read_bytes()
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE(output.stat().st_mode) == 0o666 & ~umask
+
+
+def test_write_leaves_the_umask_alone(tmp_path, monkeypatch):
+    # Other threads could create world-writable files while it is changed
+    def umask(mask):
+        raise AssertionError('umask changed')
+    monkeypatch.setattr(os, 'umask', umask)
+    SVGElement().add(Text('hello')).write(tmp_path / 'out.svg')
+
+
+def test_failed_write_leaves_no_file(tmp_path):
+    output = tmp_path / 'out.svg'
+    with pytest.raises(ValueError):
+        SVGElement().add(Text('hello')).add(Broken()).write(output)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_write_keeps_previous_file(tmp_path):
+    output = tmp_path / 'out.svg'
+    output.write_bytes(b'previous')
+    with pytest.raises(ValueError):
+        SVGElement().add(Broken()).write(output)
+    assert list(tmp_path.iterdir()) == [output]
+    assert output.read_bytes() == b'previous'
@@ -0,0 +1,43 @@
+import random
+
+from lxml import etree
+
+from benchmarks import synthetic
+from nbsvg.components.table import ELLIPSIS, DataframeTable, WrapTable, extract_df_data
+from nbsvg.style import STYLE
+
+
+def values(row):
+    return [col['value'] for col in row]
+
+
+def test_elided_rows_ignore_following_tables():
+    style = STYLE.apply({'table_max_rows': 10, 'table_head_rows': 3, 'table_tail_rows': 2})
+    html = synthetic.dataframe_html(100, 2, random.Random(0))
+    other = '<table>' + '<tr><td>x</td></tr>' * 50 + '</table>'
+    header_rows, table_data, p_data = extract_df_data(html + other, style)
+    assert header_rows == [0]
+    assert [row[0]['value'] for row in table_data[1:]] == ['0', '1', '2', ELLIPSIS, '98', '99']
+    assert p_data == '100 rows × 2 columns'
+
+
+def test_short_tables_are_not_elided():
+    style = STYLE.apply({'table_max_rows': 10})
+    html = synthetic.dataframe_html(10, 2, random.Random(0))
+    _, table_data, _ = extract_df_data(html + html, style)
+    assert len(table_data) == 11
+    assert ELLIPSIS not in values(table_data[-1])
+
+
+def test_dataframe_table_accepts_parsed_html():
+    html = synthetic.dataframe_html(5, 2, random.Random(0))
+    assert DataframeTable(etree.HTML(html)).xml == DataframeTable(html).xml
+
+
+def test_wrap_lengths_of_missing_columns_are_ignored():
+    data = [[
+        {'value': 'name', 'bold': True, 'lines': ['name']},
+        {'value': 'a long value', 'bold': False, 'lines': ['a long value']},
+    ]]
+    WrapTable(data, [0], rlen={1: 6, 5: 3, -1: 2}).do_build()
+    assert data[0][1]['lines'] == ['a long', 'value']
@@ -0,0 +1,28 @@
+from nbsvg.components import Text
+from nbsvg.components.text import elide_lines
+
+LOG = '\n'.join(f'line {i}' for i in range(100))
+
+
+def test_elide_keeps_head_and_tail():
+    lines = elide_lines(LOG, 10, 3, 2).split('\n')
+    assert lines == ['line 0', 'line 1', 'line 2', '… 95 lines omitted …', 'line 98', 'line 99']
+
+
+def test_elide_clamps_head_and_tail_to_max_lines():
+    lines = elide_lines(LOG, 10, 20, 20).split('\n')
+    assert len(lines) == 11
+    assert lines[:5] == [f'line {i}' for i in range(5)]
+    assert lines[5] == '… 90 lines omitted …'
+    assert lines[6:] == [f'line {i}' for i in range(95, 100)]
+
+
+def test_elide_short_text_is_unchanged():
+    assert elide_lines(LOG, 100, 20, 20) == LOG
+    assert elide_lines(LOG, None, 1, 1) == LOG
+
+
+def test_elided_text_height_follows_max_lines():
+    text = Text(LOG, elide=True, output_max_lines=10).do_build()
+    short = Text('\n'.join(['x'] * 11)).do_build()
+    assert text.height == short.height